@@ -3,94 +3,717 @@
 Directory Tree Deduplication Script
 
 This script compares two directory trees and removes files from the second tree
-that are identical to files in the first tree (based on SHA256 checksums).
+that are identical to files in the first tree (based on BLAKE3 or SHA256
+checksums).
 
 Usage:
-    python deduplicate_trees.py <safe_tree> <tree_to_clean> [--dry-run] [--verbose]
+    python deduplicate_trees.py <safe_tree> <tree_to_clean> [--dry-run] [--verbose] [--jobs N] [--algo NAME] [--hash-cache F]
+                                                          [--serial-verify] [--report-json]
 
 Arguments:
     safe_tree       : The reference directory tree (will NOT be modified)
     tree_to_clean   : The directory tree to remove duplicates from
     --dry-run       : Show what would be deleted without actually deleting
     --verbose       : Show detailed progress information
+    --jobs N        : Number of files to hash or delete in parallel (default: CPU count)
+    --algo NAME     : Checksum algorithm: auto, blake3, sha256 or xxh3 (default: auto)
+    --hash-cache F  : SQLite file used to remember checksums between runs
+    --serial-verify : Read the two copies of a file one after the other
+    --report-json   : End the output with a one-line JSON summary
 """
 
 import os
 import sys
 import hashlib
 import argparse
+import json
+import mmap
+import platform
+import sqlite3
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from functools import partial
 from pathlib import Path
 from datetime import datetime
 
+try:
+    import blake3
+except ImportError:
+    blake3 = None
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+
+# Size of the reusable per-thread read buffers
+READ_BUFFER_SIZE = 1 << 20
+
+# Files at least this large are memory-mapped and hashed in a single call
+MMAP_THRESHOLD = 1 << 20
+
+# Bytes of the clean copy the OS is asked to read ahead of a comparison
+READAHEAD_SIZE = 8 << 20
+
+# Number of leading bytes compared before two same-size files are hashed
+HEAD_SIZE = 4096
+
+# Minimum number of seconds between progress line updates
+PROGRESS_INTERVAL = 0.25
+
+# Comparisons queued or running per hashing thread while the scan goes on
+IN_FLIGHT_PER_WORKER = 4
+
+# Maximum number of files from one directory removed by a single deletion task
+DELETE_BATCH = 64
+
+# Checksums for which matching digests can be engineered; a cached digest
+# of one of these never stands in for reading both files
+NON_CRYPTOGRAPHIC_ALGOS = frozenset({'xxh3'})
+
+# Whether st_ctime is the inode change time. On Windows it is the creation
+# time (Python 3.8-3.12), which rewriting a file leaves alone, so there a
+# cached digest likewise never stands in for reading both files
+CTIME_IS_CHANGE_TIME = os.name != 'nt'
+
+# Number of new hash cache entries written per SQLite transaction
+CACHE_COMMIT_BATCH = 500
+
+# Below this SHA256 rate on x86_64 the OpenSSL build is probably not using
+# the CPU's SHA extensions
+SLOW_HASH_THRESHOLD_MBPS = 400
+
+
+def _make_hasher_factory():
+    """
+    Pick the SHA256 constructor to use for file checksums.
+    
+    The checksum is only a file-equivalence fingerprint, so pass
+    usedforsecurity=False (Python 3.9+) to skip FIPS wrappers that can
+    disable hardware acceleration on some OpenSSL builds.
+    """
+    try:
+        hashlib.new("sha256", usedforsecurity=False)
+    except TypeError:
+        return hashlib.sha256
+    return lambda: hashlib.new("sha256", usedforsecurity=False)
+
+
+_HASHER_FACTORY = _make_hasher_factory()
+
+
+def measure_hash_throughput(size=16 << 20):
+    """Hash a buffer of zeros and return the SHA256 throughput in MB/s."""
+    data = bytes(size)
+    start = time.perf_counter()
+    hasher = _HASHER_FACTORY()
+    hasher.update(data)
+    hasher.digest()
+    elapsed = time.perf_counter() - start
+    return (size / (1024 * 1024)) / max(elapsed, 1e-9)
+
+
+def report_hash_throughput():
+    """Print the measured hashing speed and warn if it looks unaccelerated."""
+    mbps = measure_hash_throughput()
+    print(f"SHA256 throughput: {mbps:.0f} MB/s")
+    if mbps < SLOW_HASH_THRESHOLD_MBPS and platform.machine().lower() in ('x86_64', 'amd64'):
+        print("  Warning: SHA256 hashing is slow on this machine. An OpenSSL build "
+              "with SHA extensions (SHA-NI) can be several times faster.")
+
+
+_thread_state = threading.local()
+
+
+def _read_buffers():
+    """
+    Return this thread's two reusable READ_BUFFER_SIZE buffers.
+    
+    Allocated once per worker thread rather than per file, so hashing and
+    comparing many files doesn't churn through megabyte-sized allocations.
+    """
+    buffers = getattr(_thread_state, "buffers", None)
+    if buffers is None:
+        buffers = _thread_state.buffers = (bytearray(READ_BUFFER_SIZE),
+                                           bytearray(READ_BUFFER_SIZE))
+    return buffers
+
+
+def _hash_stream(f, factory):
+    """Hash an open file by reading it sequentially with hasher factory()."""
+    if hasattr(hashlib, "file_digest"):
+        # Python 3.11+: hashing loop runs in C with its own buffer
+        return hashlib.file_digest(f, factory).digest()
+    
+    # Older Pythons: reuse one large buffer instead of allocating
+    # a new bytes object for every chunk read
+    hasher = factory()
+    buf = _read_buffers()[0]
+    view = memoryview(buf)
+    while True:
+        n = f.readinto(buf)
+        if not n:
+            break
+        hasher.update(view[:n])
+    return hasher.digest()
+
+
+def _hash_mmap(f, factory):
+    """Hash an open file by memory-mapping it and hashing the whole mapping in one call."""
+    hasher = factory()
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        if hasattr(mm, "madvise") and hasattr(mmap, "MADV_SEQUENTIAL"):
+            mm.madvise(mmap.MADV_SEQUENTIAL)
+        hasher.update(mm)
+    return hasher.digest()
+
+
+def _fadvise(fd, advice_name, offset=0, length=0):
+    """
+    Pass an access-pattern hint to the OS, where supported.
+    
+    The hint covers `length` bytes from `offset`; the default length of 0
+    means up to the end of the file.
+    """
+    advice = getattr(os, advice_name, None)
+    if advice is None:
+        # posix_fadvise is not available on Windows or macOS
+        return
+    try:
+        os.posix_fadvise(fd, offset, length, advice)
+    except OSError:
+        pass
+
+
+def _hash_file(filepath, factory):
+    """
+    Calculate the digest of a file with hasher factory(), or None on error.
+    
+    Files of MMAP_THRESHOLD bytes or more are memory-mapped and hashed in
+    one call; smaller ones (or ones that can't be mapped) are streamed.
+    """
+    try:
+        with open(filepath, "rb", buffering=0) as f:
+            _fadvise(f.fileno(), "POSIX_FADV_SEQUENTIAL")
+            checksum = None
+            if os.fstat(f.fileno()).st_size >= MMAP_THRESHOLD:
+                try:
+                    checksum = _hash_mmap(f, factory)
+                except (OSError, ValueError):
+                    # Some filesystems can't be memory-mapped; stream instead
+                    f.seek(0)
+            if checksum is None:
+                checksum = _hash_stream(f, factory)
+            return checksum
+    except Exception as e:
+        print(f"Error reading {filepath}: {e}")
+        return None
+
 
 def calculate_sha256(filepath):
-    """Calculate SHA256 checksum of a file."""
-    sha256_hash = hashlib.sha256()
+    """Calculate the SHA256 digest (32 raw bytes) of a file."""
+    return _hash_file(filepath, _HASHER_FACTORY)
+
+
+def calculate_xxh3(filepath):
+    """
+    Calculate the XXH3 128-bit digest (16 raw bytes) of a file.
+    
+    XXH3 is a non-cryptographic hash many times faster than SHA256, and
+    files with the same XXH3 digest are easy to construct. A digest match
+    alone therefore never counts as a duplicate: matches() always compares
+    both files byte for byte, and cached XXH3 digests are only used to rule
+    matches out.
+    """
+    return _hash_file(filepath, xxhash.xxh3_128)
+
+
+def calculate_blake3(filepath):
+    """
+    Calculate the BLAKE3 digest (32 raw bytes) of a file.
+    
+    The file is memory-mapped and hashed by the blake3 package, which uses
+    SIMD and multiple threads for large files.
+    """
     try:
-        with open(filepath, "rb") as f:
-            # Read in chunks to handle large files
-            for byte_block in iter(lambda: f.read(4096), b""):
-                sha256_hash.update(byte_block)
-        return sha256_hash.hexdigest()
+        hasher = blake3.blake3(max_threads=blake3.blake3.AUTO)
+        hasher.update_mmap(filepath)
+        return hasher.digest()
     except Exception as e:
         print(f"Error reading {filepath}: {e}")
         return None
 
 
-def scan_directory_tree(root_path, verbose=False):
+def new_hasher(algo):
+    """Create an incremental hasher object for `algo`."""
+    if algo == 'blake3':
+        return blake3.blake3(max_threads=blake3.blake3.AUTO)
+    if algo == 'xxh3':
+        return xxhash.xxh3_128()
+    return _HASHER_FACTORY()
+
+
+# Checksum functions selectable with --algo
+HASH_FUNCTIONS = {
+    'blake3': calculate_blake3,
+    'sha256': calculate_sha256,
+    'xxh3': calculate_xxh3,
+}
+
+
+def calculate_hash(filepath, algo="sha256"):
+    """Calculate the `algo` digest (raw bytes) of a file, or None on error."""
+    return HASH_FUNCTIONS[algo](filepath)
+
+
+def resolve_algo(algo):
+    """Map the --algo choice to a key of HASH_FUNCTIONS ('auto' prefers BLAKE3)."""
+    if algo == 'auto':
+        return 'blake3' if blake3 is not None else 'sha256'
+    return algo
+
+
+class HashCache:
+    """
+    Persistent SQLite store of digests keyed by (device, inode, algorithm).
+    
+    An entry is only used while the file's size, modification time and
+    status change time are unchanged, so unmodified files are not read
+    again on later runs. The change time is checked because tools such as
+    `cp -p`, `rsync -t` or `touch -d` can put back an old modification
+    time, whereas on POSIX systems every write or utime call moves the
+    change time to the current time and ordinary tools can't set it back.
+    On Windows st_ctime is the creation time instead, which gives no such
+    guarantee (see CTIME_IS_CHANGE_TIME). New entries are committed in
+    batches of CACHE_COMMIT_BATCH. Safe to share between hashing threads.
+    """
+    
+    def __init__(self, path):
+        self._conn = sqlite3.connect(os.fspath(path), check_same_thread=False)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.hits = 0
+        # Write-ahead logging makes each batch commit a sequential append
+        # instead of a rollback-journal rewrite; losing the last batch in a
+        # crash only means re-hashing those files
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(digests)")}
+        if columns and "ctime_ns" not in columns:
+            # Written by a version that didn't record change times, so its
+            # entries can't be validated; start afresh
+            self._conn.execute("DROP TABLE digests")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS digests ("
+            "dev INTEGER, ino INTEGER, algo TEXT, size INTEGER, mtime_ns INTEGER, "
+            "ctime_ns INTEGER, digest BLOB, PRIMARY KEY (dev, ino, algo))"
+        )
+        self._conn.commit()
+    
+    def get(self, st, algo):
+        """Return the cached checksum for a stat result, or None if unknown or stale."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT digest FROM digests "
+                "WHERE dev=? AND ino=? AND algo=? AND size=? AND mtime_ns=? AND ctime_ns=?",
+                (st.st_dev, st.st_ino, algo, st.st_size, st.st_mtime_ns, st.st_ctime_ns),
+            ).fetchone()
+            if row is None:
+                return None
+            self.hits += 1
+            return row[0]
+    
+    def put(self, st, algo, checksum):
+        """Remember the checksum of the file described by a stat result."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO digests VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (st.st_dev, st.st_ino, algo, st.st_size, st.st_mtime_ns,
+                 st.st_ctime_ns, checksum),
+            )
+            self._pending += 1
+            if self._pending >= CACHE_COMMIT_BATCH:
+                self._conn.commit()
+                self._pending = 0
+    
+    def close(self):
+        """Commit outstanding entries and close the database."""
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
+
+
+def _cache_lookup(cache, filepath, algo):
+    """
+    Look a file up in the hash cache.
+    
+    Returns:
+        tuple: (stat_result or None if the file can't be stat'ed, cached digest or None)
+    """
+    try:
+        st = os.stat(filepath)
+    except OSError:
+        return None, None
+    return st, cache.get(st, algo)
+
+
+class ProgressReporter:
+    """
+    Throttled single-line progress counter written to stderr.
+    
+    Counting is cheap; the line is redrawn with a carriage return at most
+    every PROGRESS_INTERVAL seconds, so per-file terminal writes don't slow
+    down scans of many small files.
+    """
+    
+    def __init__(self, label, enabled=True):
+        self.label = label
+        self.enabled = enabled
+        self.count = 0
+        self._last_emit = time.monotonic()
+        self._drawn = False
+    
+    def update(self, n=1):
+        """Count n more items, redrawing the line if the interval has passed."""
+        self.count += n
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        if now - self._last_emit >= PROGRESS_INTERVAL:
+            self._last_emit = now
+            self._draw()
+    
+    def finish(self):
+        """Draw the final count and end the progress line."""
+        if self.enabled and self._drawn:
+            self._draw()
+            sys.stderr.write("\n")
+            sys.stderr.flush()
+    
+    def _draw(self):
+        sys.stderr.write(f"\r  {self.label}: {self.count}")
+        sys.stderr.flush()
+        self._drawn = True
+
+
+def default_jobs():
+    """Number of hashing threads to use when --jobs is not given."""
+    return os.cpu_count() or 1
+
+
+def _walk(root, dir_counts=None):
+    """
+    Yield an os.DirEntry for every file and directory below root.
+    
+    Uses os.scandir directly so type checks are answered from the directory
+    listing instead of extra stat calls. Symbolic links are not followed
+    and not yielded.
+    
+    If dir_counts is a dict, the number of entries of every directory
+    listed (root included, symlinks and other entries counted too) is
+    stored in it, keyed by path. Parents are always listed before their
+    children, so the dict is in top-down order. A directory whose listing
+    fails, even partway through, gets no count, although entries already
+    read from it are still yielded.
+    """
+    stack = [os.fspath(root)]
+    while stack:
+        dirpath = stack.pop()
+        try:
+            with os.scandir(dirpath) as it:
+                count = 0
+                for count, entry in enumerate(it, 1):
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                        yield entry
+                    elif entry.is_file(follow_symlinks=False):
+                        yield entry
+        except OSError as e:
+            print(f"Error reading {dirpath}: {e}")
+            continue
+        if dir_counts is not None:
+            dir_counts[dirpath] = count
+
+
+def index_sizes(root_path, verbose=False):
     """
-    Scan a directory tree and create a mapping of relative paths to checksums.
+    Scan a directory tree and record the size of every file, without reading it.
+    
+    Only the relative path and size are kept per file; absolute paths are
+    rebuilt with os.path.join(root, relative_path) for the few files that
+    get compared, which roughly halves memory use on large trees.
     
     Returns:
-        dict: {relative_path: (absolute_path, checksum)}
+        dict: {relative_path: size}
     """
     file_map = {}
-    root = Path(root_path).resolve()
+    root = os.fspath(Path(root_path).resolve())
     
     if verbose:
         print(f"\nScanning {root}...")
     
-    file_count = 0
-    for dirpath, dirnames, filenames in os.walk(root):
-        print(f" scanning {dirpath}")
-        for filename in filenames:
-            filepath = Path(dirpath) / filename
-            relative_path = filepath.relative_to(root)
-            
-            if verbose: print(f"Scanning: {filepath}")
-            checksum = calculate_sha256(filepath)
-            if verbose: print(f"{filename} checksum is {checksum}")
-            if checksum:
-                file_map[str(relative_path)] = (str(filepath), checksum)
-                file_count += 1
-                if verbose and file_count % 100 == 0:
-                    print(f"  Scanned {file_count} files...")
+    # Entry paths all start with the root and a separator, so relative
+    # paths are a slice rather than an os.path.relpath() call per file
+    root_len = len(os.path.join(root, ""))
+    
+    progress = ProgressReporter("Files scanned", enabled=verbose)
+    for entry in _walk(root):
+        if not entry.is_file(follow_symlinks=False):
+            continue
+        try:
+            size = entry.stat(follow_symlinks=False).st_size
+        except OSError as e:
+            print(f"Error reading {entry.path}: {e}")
+            continue
+        file_map[entry.path[root_len:]] = size
+        progress.update()
+    progress.finish()
     
     if verbose:
-        print(f"  Total: {file_count} files")
+        print(f"  Total: {progress.count} files")
     
     return file_map
 
 
-def find_duplicates(safe_map, clean_map, verbose=False):
+def _readinto_full(f, buf):
+    """Fill buf from f; returns fewer than len(buf) bytes only at end of file."""
+    view = memoryview(buf)
+    total = 0
+    while total < len(buf):
+        n = f.readinto(view[total:])
+        if not n:
+            break
+        total += n
+    return total
+
+
+def compare_files(safe_filepath, clean_filepath, algo="sha256", reader=None):
     """
-    Find files in clean_map that are identical to files in safe_map.
+    Compare two files byte by byte, hashing the safe copy along the way.
+    
+    The first HEAD_SIZE bytes are compared first as a cheap discriminator,
+    since most same-size files that differ do so early. Reading then carries
+    on from the same position in larger chunks with the same hasher, so each
+    file is opened and read exactly once and only one of them is hashed.
+    
+    If `reader` (an executor) is given, each chunk of the clean copy is read
+    on it while the safe copy's chunk is read and hashed on this thread, so
+    both devices are kept busy at once. Without it the two files are read
+    one after the other.
     
     Returns:
-        list: List of (filepath, relative_path) tuples to delete
+        bytes: The digest of the identical files, or None if they differ
     """
+    hasher = new_hasher(algo)
+    safe_buf, clean_buf = _read_buffers()
+    try:
+        with open(safe_filepath, "rb", buffering=0) as safe_f, \
+                open(clean_filepath, "rb", buffering=0) as clean_f:
+            n = _readinto_full(safe_f, memoryview(safe_buf)[:HEAD_SIZE])
+            if _readinto_full(clean_f, memoryview(clean_buf)[:HEAD_SIZE]) != n:
+                return None
+            if safe_buf[:n] != clean_buf[:n]:
+                return None
+            hasher.update(memoryview(safe_buf)[:n])
+            
+            if n == HEAD_SIZE:
+                # Heads match: read the clean copy ahead while the safe copy
+                # is read and hashed
+                _fadvise(safe_f.fileno(), "POSIX_FADV_SEQUENTIAL")
+                clean_pos = advised_to = n
+                while True:
+                    if clean_pos >= advised_to:
+                        # Ask for the next READAHEAD_SIZE bytes only, not the
+                        # whole file, so large files don't flood the page
+                        # cache; renewed halfway through each window
+                        _fadvise(clean_f.fileno(), "POSIX_FADV_WILLNEED",
+                                 clean_pos, READAHEAD_SIZE)
+                        advised_to = clean_pos + READAHEAD_SIZE // 2
+                    if reader is not None:
+                        clean_read = reader.submit(_readinto_full, clean_f, clean_buf)
+                        try:
+                            # Hashing before comparing overlaps it with the
+                            # clean read; a mismatch wastes one chunk of it
+                            n = _readinto_full(safe_f, safe_buf)
+                            hasher.update(memoryview(safe_buf)[:n])
+                        finally:
+                            # Never leave the file or buffer in use by the
+                            # reader once this function returns
+                            clean_n = clean_read.result()
+                    else:
+                        n = _readinto_full(safe_f, safe_buf)
+                        hasher.update(memoryview(safe_buf)[:n])
+                        clean_n = _readinto_full(clean_f, clean_buf)
+                    if clean_n != n:
+                        return None
+                    clean_pos += clean_n
+                    if n < len(safe_buf):
+                        # Final partial chunk (bytearray == is a memcmp;
+                        # slicing copies, so only do it here)
+                        if safe_buf[:n] != clean_buf[:n]:
+                            return None
+                        break
+                    if safe_buf != clean_buf:
+                        return None
+    except Exception as e:
+        print(f"Error comparing {safe_filepath} with {clean_filepath}: {e}")
+        return None
+    return hasher.digest()
+
+
+def matches(safe_filepath, clean_filepath, algo="sha256", cache=None, reader=None):
+    """
+    Check whether two files of equal size have identical content.
+    
+    Uncached files are compared with compare_files(), which reads the
+    clean copy on `reader` if one is given. When `cache` already
+    knows a file's digest that file isn't read: two cached digests are
+    compared directly, and with one cached digest only the other file is
+    hashed. For NON_CRYPTOGRAPHIC_ALGOS, and on platforms where
+    CTIME_IS_CHANGE_TIME is false, cached digests only rule a match out;
+    otherwise both files are still compared byte for byte.
+    
+    Returns:
+        bytes: The shared digest if the files match, otherwise None
+    """
+    safe_st = clean_st = safe_digest = clean_digest = None
+    if cache is not None:
+        safe_st, safe_digest = _cache_lookup(cache, safe_filepath, algo)
+        clean_st, clean_digest = _cache_lookup(cache, clean_filepath, algo)
+    
+    confirm = algo in NON_CRYPTOGRAPHIC_ALGOS or not CTIME_IS_CHANGE_TIME
+    if confirm and None not in (safe_digest, clean_digest) and safe_digest != clean_digest:
+        return None
+    
+    if (safe_digest is None and clean_digest is None) or confirm:
+        uncached = [st for st, digest in ((safe_st, safe_digest), (clean_st, clean_digest))
+                    if digest is None]
+        safe_digest = clean_digest = compare_files(safe_filepath, clean_filepath, algo, reader)
+        new_entries = [(st, safe_digest) for st in uncached]
+    elif safe_digest is None:
+        safe_digest = calculate_hash(safe_filepath, algo)
+        new_entries = ((safe_st, safe_digest),)
+    elif clean_digest is None:
+        clean_digest = calculate_hash(clean_filepath, algo)
+        new_entries = ((clean_st, clean_digest),)
+    else:
+        new_entries = ()
+    
+    if cache is not None:
+        for st, digest in new_entries:
+            if st is not None and digest is not None:
+                cache.put(st, algo, digest)
+    
+    if safe_digest is None or safe_digest != clean_digest:
+        return None
+    return safe_digest
+
+
+def scan_and_match(safe_root, safe_map, clean_root, verbose=False, jobs=None,
+                   algo="sha256", cache=None, dir_counts=None, serial_verify=False):
+    """
+    Scan the tree to clean and find files identical to files in safe_map.
+    
+    Scanning and matching are fused: each file found under clean_root is
+    looked up in safe_map (from index_sizes() on safe_root) straight away,
+    and a same-size file at the same relative path is handed to matches()
+    on a thread pool of `jobs` workers. Comparisons overlap with the rest
+    of the scan, and no map of the tree to clean is kept in memory. At most
+    IN_FLIGHT_PER_WORKER comparisons per worker are queued at once; the
+    scan waits for one to finish before queueing more, so memory use stays
+    flat and an interrupt doesn't wait for a long queue to drain. Files
+    with no counterpart in the safe tree are not even stat'ed, and pairs
+    of empty files match without being opened.
+    
+    Unless serial_verify is set, a second pool of `jobs` threads reads the
+    clean copy of each pair while the worker reads the safe copy.
+    
+    If dir_counts is a dict, it is filled with the number of entries in
+    each directory of the tree to clean, for cleanup_empty_directories().
+    
+    Returns:
+        list: List of (clean_filepath, safe_filepath, digest, size) tuples
+        to delete, sorted by path
+    """
+    root = os.fspath(Path(clean_root).resolve())
+    root_len = len(os.path.join(root, ""))
+    
+    if verbose:
+        print(f"\nScanning {root}...")
+    
+    in_flight = {}
     to_delete = []
+    workers = jobs or default_jobs()
+    max_in_flight = workers * IN_FLIGHT_PER_WORKER
+    empty_digest = new_hasher(algo).digest()
     
-    for rel_path, (clean_filepath, clean_checksum) in clean_map.items():
-        if rel_path in safe_map:
-            safe_filepath, safe_checksum = safe_map[rel_path]
-            
-            if clean_checksum == safe_checksum:
-                #to_delete.append((clean_filepath, rel_path))
-                to_delete.append((clean_filepath, safe_filepath, clean_checksum))
+    def collect(future):
+        clean_filepath, safe_filepath, size = in_flight.pop(future)
+        checksum = future.result()
+        if checksum is not None:
+            to_delete.append((clean_filepath, safe_filepath, checksum, size))
+    
+    reader = None if serial_verify else ThreadPoolExecutor(max_workers=workers)
+    try:
+        check = partial(matches, algo=algo, cache=cache, reader=reader)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            try:
+                scanned = ProgressReporter("Files scanned", enabled=verbose)
+                for entry in _walk(root, dir_counts):
+                    if not entry.is_file(follow_symlinks=False):
+                        continue
+                    scanned.update()
+                    
+                    rel_path = entry.path[root_len:]
+                    safe_size = safe_map.get(rel_path)
+                    if safe_size is None:
+                        continue
+                    try:
+                        size = entry.stat(follow_symlinks=False).st_size
+                    except OSError as e:
+                        print(f"Error reading {entry.path}: {e}")
+                        continue
+                    if size != safe_size:
+                        continue
+                    
+                    safe_filepath = os.path.join(safe_root, rel_path)
+                    if size == 0:
+                        # Two empty files are identical; no need to read them
+                        to_delete.append((entry.path, safe_filepath, empty_digest, size))
+                        continue
+                    if len(in_flight) >= max_in_flight:
+                        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            collect(future)
+                    future = pool.submit(check, safe_filepath, entry.path)
+                    in_flight[future] = (entry.path, safe_filepath, size)
+                scanned.finish()
+                
                 if verbose:
-                    print(f"  Match found: {rel_path}")
+                    print(f"  Total: {scanned.count} files")
+                
+                compared = ProgressReporter("Candidates compared", enabled=verbose)
+                for future in as_completed(list(in_flight)):
+                    collect(future)
+                    compared.update()
+                compared.finish()
+            except BaseException:
+                # Drop queued comparisons so leaving the pool only waits
+                # for the few that are already running
+                for future in in_flight:
+                    future.cancel()
+                raise
+    finally:
+        if reader is not None:
+            reader.shutdown()
     
+    # Keep the report in a stable order regardless of traversal order
+    to_delete.sort()
+    if verbose:
+        for clean_filepath, _, _, _ in to_delete:
+            print(f"  Match found: {clean_filepath[root_len:]}")
     return to_delete
 
 
@@ -103,16 +726,68 @@ def format_size(size_bytes):
     return f"{size_bytes:.2f} PB"
 
 
-def delete_files(to_delete, dry_run=True):
+def _remove_file(clean_path):
+    """Delete a file, returning the exception instead of raising it."""
+    try:
+        os.remove(clean_path)
+    except Exception as e:
+        return e
+    return None
+
+
+def _remove_files_in(dirpath, paths):
+    """
+    Delete files that all live directly in dirpath.
+    
+    Where the platform supports it, the directory is opened once and each
+    file is unlinked relative to it, so its path isn't resolved again from
+    the root for every file.
+    
+    Returns:
+        list: The exception for each path (None if it was deleted), in order
+    """
+    if len(paths) < 2 or os.unlink not in os.supports_dir_fd:
+        return [_remove_file(path) for path in paths]
+    try:
+        dir_fd = os.open(dirpath, os.O_RDONLY | getattr(os, "O_DIRECTORY", 0))
+    except OSError:
+        return [_remove_file(path) for path in paths]
+    
+    errors = []
+    try:
+        for path in paths:
+            try:
+                os.unlink(os.path.basename(path), dir_fd=dir_fd)
+            except Exception as e:
+                errors.append(e)
+            else:
+                errors.append(None)
+    finally:
+        os.close(dir_fd)
+    return errors
+
+
+def delete_files(to_delete, dry_run=True, algo="sha256", jobs=None):
     """
     Delete files from the list.
     
+    Sizes come from the scan, so no file is stat'ed again here. Files are
+    grouped by directory and each directory's files are removed together
+    (see _remove_files_in) on a thread pool of `jobs` workers, so on network
+    filesystems many round trips are in flight at once; results are still
+    reported in list order.
+    
     Args:
-        to_delete: List of (filepath, relative_path) tuples
+        to_delete: List of (clean_path, safe_path, digest, size) tuples
         dry_run: If True, only show what would be deleted
+        algo: Name of the checksum algorithm, used to label the checksum
+        jobs: Number of files to delete in parallel
+    
+    Returns:
+        list: Paths of the files actually deleted (empty in dry run mode)
     """
     total_size = 0
-    deleted_count = 0
+    deleted = []
     
     print(f"\n{'=' * 70}")
     if dry_run:
@@ -120,65 +795,103 @@ def delete_files(to_delete, dry_run=True):
     else:
         print("DELETING FILES")
     print(f"{'=' * 70}\n")
-
-  # for filepath, rel_path in to_delete:
-    for clean_path, safe_path, checksum in to_delete:
-        try:
-            file_size = os.path.getsize(clean_path)
+    
+    with ThreadPoolExecutor(max_workers=jobs or default_jobs()) as pool:
+        if dry_run:
+            errors = [None] * len(to_delete)
+        else:
+            by_dir = {}
+            for clean_path, _, _, _ in to_delete:
+                by_dir.setdefault(os.path.dirname(clean_path), []).append(clean_path)
+            # Split large directories so their files are still removed in parallel
+            batches = [(dirpath, paths[i:i + DELETE_BATCH])
+                       for dirpath, paths in by_dir.items()
+                       for i in range(0, len(paths), DELETE_BATCH)]
+            error_of = {}
+            results = pool.map(_remove_files_in, *zip(*batches)) if batches else []
+            for (_, paths), batch_errors in zip(batches, results):
+                error_of.update(zip(paths, batch_errors))
+            errors = [error_of[clean_path] for clean_path, _, _, _ in to_delete]
+        
+        for (clean_path, safe_path, checksum, file_size), error in zip(to_delete, errors):
             total_size += file_size
             
             # Display sequential information for ease of reading
             print(f"  [REFERENCE]    {safe_path}")
             print(f"  {'[WOULD DELETE]' if dry_run else '[DELETING]'} {clean_path}")
-            print(f"  [SHA256]:{checksum}  [SIZE]:{format_size(file_size)}\n")
-         
-            if not dry_run:
-                os.remove(clean_path)
-                deleted_count += 1
-        except Exception as e:
-            print(f"  ERROR with {clean_path}: {e}")
+            print(f"  [{algo.upper()}]:{checksum.hex()}  [SIZE]:{format_size(file_size)}\n")
+            
+            if error is not None:
+                print(f"  ERROR with {clean_path}: {error}")
+            elif not dry_run:
+                deleted.append(clean_path)
     
     print(f"\n{'=' * 70}")
     print(f"Summary:")
     print(f"  Files {'that would be' if dry_run else ''} deleted: {len(to_delete)}")
     print(f"  Total size {'that would be' if dry_run else ''} freed: {format_size(total_size)}")
     if not dry_run:
-        print(f"  Successfully deleted: {deleted_count}")
+        print(f"  Successfully deleted: {len(deleted)}")
     print(f"{'=' * 70}\n")
+    
+    return deleted
 
 
-def cleanup_empty_directories(root_path, dry_run=True, verbose=False):
+def cleanup_empty_directories(root_path, dir_counts, deleted, dry_run=True, verbose=False):
     """
     Remove empty directories after file deletion.
+    
+    Rather than walking the tree again, the entry counts recorded while
+    scanning (dir_counts, from scan_and_match()) are reduced by the files
+    that were deleted, and only directories whose count drops to zero are
+    removed. Removing a directory in turn reduces its parent's count.
+    Directories without a count (their listing failed) are never removed.
     """
     if dry_run:
         return
     
     removed_dirs = []
-    root = Path(root_path).resolve()
+    root = os.fspath(Path(root_path).resolve())
     
-    # Walk bottom-up so we can remove empty child directories first
-    for dirpath, dirnames, filenames in os.walk(root, topdown=False):
-        # Skip the root directory itself
-        if dirpath == str(root):
+    remaining = dict(dir_counts)
+    for path in deleted:
+        dirpath = os.path.dirname(path)
+        if dirpath in remaining:
+            remaining[dirpath] -= 1
+    
+    # Parents were recorded before their children, so going through the
+    # directories in reverse removes empty child directories first
+    for dirpath in reversed(list(remaining)):
+        if dirpath == root or remaining[dirpath] != 0:
             continue
-        
-        # Check if directory is empty
         try:
-            if not os.listdir(dirpath):
-                os.rmdir(dirpath)
-                removed_dirs.append(dirpath)
-                if verbose:
-                    print(f"  Removed empty directory: {Path(dirpath).relative_to(root)}")
+            os.rmdir(dirpath)
         except Exception as e:
             if verbose:
                 print(f"  Could not remove {dirpath}: {e}")
+            continue
+        removed_dirs.append(dirpath)
+        parent = os.path.dirname(dirpath)
+        if parent in remaining:
+            remaining[parent] -= 1
+        if verbose:
+            print(f"  Removed empty directory: {os.path.relpath(dirpath, root)}")
     
     if removed_dirs:
         print(f"\nRemoved {len(removed_dirs)} empty directories")
 
 
-def main():
+def print_report(dry_run, to_delete, deleted):
+    """Print a one-line JSON summary of the run (for --report-json)."""
+    print(json.dumps({
+        "dry_run": dry_run,
+        "would_delete": len(to_delete),
+        "deleted": len(deleted),
+        "bytes": sum(size for _, _, _, size in to_delete),
+    }))
+
+
+def main(argv=None):
     parser = argparse.ArgumentParser(
         description='Compare two directory trees and remove duplicate files from the second tree.',
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -201,8 +914,22 @@ Examples:
                        help='Show what would be deleted without actually deleting (RECOMMENDED FIRST)')
     parser.add_argument('--verbose', '-v', action='store_true',
                        help='Show detailed progress information')
+    parser.add_argument('--jobs', '-j', type=int, default=None,
+                       help='Number of files to hash or delete in parallel (default: number of CPUs)')
+    parser.add_argument('--algo', choices=['auto', 'blake3', 'sha256', 'xxh3'], default='auto',
+                       help='Checksum algorithm (default: auto, which uses BLAKE3 if the '
+                            'blake3 package is installed, otherwise SHA256; xxh3 is fastest '
+                            'but not cryptographic)')
+    parser.add_argument('--serial-verify', action='store_true',
+                       help='Read the two copies of a file one after the other instead '
+                            'of concurrently (can help when both trees are on one disk)')
+    parser.add_argument('--hash-cache', metavar='FILE', default=None,
+                       help='SQLite file that remembers checksums of unchanged files '
+                            'between runs (created if missing)')
+    parser.add_argument('--report-json', action='store_true',
+                       help='Print a one-line JSON summary as the last line of output')
     
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     
     # Validate paths
     safe_path = Path(args.safe_tree)
@@ -224,56 +951,96 @@ Examples:
         print(f"Error: Tree to clean path is not a directory: {clean_path}")
         sys.exit(1)
     
+    if args.jobs is not None and args.jobs < 1:
+        print(f"Error: --jobs must be at least 1, got {args.jobs}")
+        sys.exit(1)
+    
+    if args.algo == 'blake3' and blake3 is None:
+        print("Error: --algo blake3 requires the blake3 package (pip install blake3)")
+        sys.exit(1)
+    if args.algo == 'xxh3' and xxhash is None:
+        print("Error: --algo xxh3 requires the xxhash package (pip install xxhash)")
+        sys.exit(1)
+    algo = resolve_algo(args.algo)
+    
     # Check if paths are the same
     if safe_path.resolve() == clean_path.resolve():
         print("Error: Both paths point to the same directory!")
         sys.exit(1)
     
-    print(f"\n{'=' * 70}")
-    print("Directory Tree Deduplication")
-    print(f"{'=' * 70}")
-    print(f"Safe tree (reference):  {safe_path.resolve()}")
-    print(f"Tree to clean:          {clean_path.resolve()}")
-    print(f"Mode:                   {'DRY RUN' if args.dry_run else 'LIVE DELETE'}")
-    print(f"{'=' * 70}\n")
-    
-    if not args.dry_run:
-        response = input("WARNING: This will DELETE files. Are you sure? (yes/no): ")
-        if response.lower() != 'yes':
-            print("Aborted.")
-            sys.exit(0)
-    
-    # Scan both trees
-    print("Step 1: Scanning safe tree...")
-    safe_map = scan_directory_tree(safe_path, args.verbose)
-    
-    print("\nStep 2: Scanning tree to clean...")
-    clean_map = scan_directory_tree(clean_path, args.verbose)
+    # Open the hash cache now, so a bad path is reported before the prompt
+    # and the scan rather than after them
+    cache = None
+    if args.hash_cache:
+        try:
+            cache = HashCache(args.hash_cache)
+        except sqlite3.Error as e:
+            print(f"Error: Could not open hash cache {args.hash_cache}: {e}")
+            sys.exit(1)
     
-    # Find duplicates
-    print("\nStep 3: Finding duplicate files...")
-    to_delete = find_duplicates(safe_map, clean_map, args.verbose)
+    try:
+        print(f"\n{'=' * 70}")
+        print("Directory Tree Deduplication")
+        print(f"{'=' * 70}")
+        print(f"Safe tree (reference):  {safe_path.resolve()}")
+        print(f"Tree to clean:          {clean_path.resolve()}")
+        print(f"Mode:                   {'DRY RUN' if args.dry_run else 'LIVE DELETE'}")
+        print(f"Checksum algorithm:     {algo.upper()}")
+        print(f"{'=' * 70}\n")
+        
+        if not args.dry_run:
+            response = input("WARNING: This will DELETE files. Are you sure? (yes/no): ")
+            if response.lower() != 'yes':
+                print("Aborted.")
+                sys.exit(0)
+        
+        if args.verbose and algo == 'sha256':
+            report_hash_throughput()
+            print()
+        
+        safe_root = os.fspath(safe_path.resolve())
+        clean_root = os.fspath(clean_path.resolve())
+        
+        print("Step 1: Scanning safe tree...")
+        safe_map = index_sizes(safe_root, args.verbose)
+        
+        # Scan the tree to clean and compare candidates as they are found
+        print("\nStep 2: Scanning tree to clean and finding duplicate files...")
+        dir_counts = {}
+        to_delete = scan_and_match(safe_root, safe_map, clean_root,
+                                   args.verbose, args.jobs, algo, cache, dir_counts,
+                                   args.serial_verify)
+    finally:
+        if cache is not None:
+            cache.close()
+    if cache is not None and args.verbose:
+        print(f"  Hash cache hits: {cache.hits}")
     
     print(f"\nFound {len(to_delete)} duplicate files")
     
     if not to_delete:
         print("No duplicates found. Nothing to do.")
+        if args.report_json:
+            print_report(args.dry_run, to_delete, [])
         sys.exit(0)
     
     # Delete files
-    print("\nStep 4: Processing files...")
-    delete_files(to_delete, args.dry_run)
+    print("\nStep 3: Processing files...")
+    deleted = delete_files(to_delete, args.dry_run, algo, args.jobs)
     
     # Clean up empty directories
     if not args.dry_run:
-        print("\nStep 5: Cleaning up empty directories...")
-        cleanup_empty_directories(clean_path, args.dry_run, args.verbose)
+        print("\nStep 4: Cleaning up empty directories...")
+        cleanup_empty_directories(clean_root, dir_counts, deleted, args.dry_run, args.verbose)
     
     if args.dry_run:
         print("\n" + "=" * 70)
         print("This was a DRY RUN. No files were actually deleted.")
         print("To actually delete files, run again without --dry-run")
         print("=" * 70)
+    
+    if args.report_json:
+        print_report(args.dry_run, to_delete, deleted)
 
 
 if __name__ == "__main__":
@@ -2,76 +2,310 @@
 """
 Black-box test suite for deduplicate_trees.py
 
-Tests the script as users would run it - via command line only.
-No imports from the script itself.
+Tests the script as users would run it - via command line arguments only.
+The script's main() is called in-process with those arguments rather than
+starting a new interpreter for every run; nothing else is imported from it.
 
-Run with: python test_deduplicate_trees.py
+Run with: python test_deduplicate_trees.py [--cache] [--verbose] [--failfast]
+
+Only failing assertions are printed, each failing test's assertion count
+after them, and one total line for the suite; --verbose also prints passing
+assertions and a count line for every test.
+
+Every test runs by default. With --cache, tests that passed are remembered
+in ~/.cache/deduplicate_trees_tests.json and skipped on the next --cache run
+if neither this file, the script, the Python environment, the platform nor
+the temporary directory changed. --failfast runs the tests one at a time
+and stops at the first failure.
+
+Test trees are created under /dev/shm on Linux; set DEDUP_TESTS_TMPDIR to
+use another directory (or to an empty string for the system default).
 """
 
+import argparse
+import importlib.util
+import io
+import json
 import os
+import shutil
 import sys
 import tempfile
+import time
 import subprocess
 import hashlib
+import traceback
+import types
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager, redirect_stdout, redirect_stderr
 from pathlib import Path
 
 
+# Print passing assertions too (set by --verbose); failures are always shown
+VERBOSE = False
+
+
 class TestCase:
     """Simple test case class"""
+    # (passed, total) assertion counts of every summary() in this process
+    completed = []
+    
     def __init__(self, name):
         self.name = name
         self.passed = 0
         self.failed = 0
     
+    def _pass(self, msg):
+        self.passed += 1
+        if VERBOSE:
+            print(f"  [PASS] {msg or 'Assertion passed'}")
+    
+    def _fail(self, msg, *details):
+        self.failed += 1
+        print("\n    ".join([f"  [FAIL] {msg or 'Assertion failed'}", *details]))
+    
     def assert_equal(self, actual, expected, msg=""):
         if actual == expected:
-            self.passed += 1
-            print(f"  [PASS] {msg or 'Assertion passed'}")
+            self._pass(msg)
         else:
-            self.failed += 1
-            print(f"  [FAIL] {msg or 'Assertion failed'}")
-            print(f"    Expected: {expected}")
-            print(f"    Got: {actual}")
+            self._fail(msg, f"Expected: {expected!r}", f"Got: {actual!r}")
     
     def assert_true(self, condition, msg=""):
-        self.assert_equal(condition, True, msg)
+        if condition:
+            self._pass(msg)
+        else:
+            self._fail(msg)
     
     def assert_false(self, condition, msg=""):
-        self.assert_equal(condition, False, msg)
+        if not condition:
+            self._pass(msg)
+        else:
+            self._fail(msg)
+    
+    def assert_set_equal(self, actual, expected, msg=""):
+        """Compare two sets, reporting only the differences on failure"""
+        actual, expected = set(actual), set(expected)
+        if actual == expected:
+            self._pass(msg)
+        else:
+            self._fail(msg, f"Missing: {sorted(expected - actual)}",
+                       f"Unexpected: {sorted(actual - expected)}")
     
     def summary(self):
+        """
+        Record this test's counts for the suite total and return whether it
+        passed. A per-test line is printed only for failures or --verbose.
+        """
         total = self.passed + self.failed
-        print(f"\n{self.name}: {self.passed}/{total} passed")
+        TestCase.completed.append((self.passed, total))
+        if VERBOSE or self.failed:
+            print(f"\n{self.name}: {self.passed}/{total} passed")
         return self.failed == 0
 
 
+# Directories already created by ensure_dir(); test directories are
+# never reused, so entries only go stale if the script removes a directory
+_CREATED_DIRS = set()
+
+
+def ensure_dir(dirpath):
+    """Create a directory and its parents, once per directory"""
+    if dirpath not in _CREATED_DIRS:
+        dirpath.mkdir(parents=True, exist_ok=True)
+        _CREATED_DIRS.add(dirpath)
+
+
+def ensure_parent(path):
+    """Create the parent directory of path, once per directory"""
+    ensure_dir(path.parent)
+
+
 def create_test_file(path, content):
     """Helper to create a test file with specific content"""
-    path.parent.mkdir(parents=True, exist_ok=True)
-    with open(path, 'wb') as f:
+    ensure_parent(path)
+    try:
+        f = open(path, 'wb')
+    except FileNotFoundError:
+        # The directory was removed since, e.g. by the script's cleanup
+        path.parent.mkdir(parents=True, exist_ok=True)
+        f = open(path, 'wb')
+    with f:
         f.write(content)
 
 
+def create_test_files(parent, items):
+    """
+    Helper to create several files directly in one directory.
+    
+    items is a list of (name, content) pairs. Where supported, the directory
+    is opened once and each file created relative to it, instead of
+    resolving the full path for every file.
+    """
+    ensure_dir(parent)
+    if os.open not in os.supports_dir_fd:
+        for name, content in items:
+            create_test_file(parent / name, content)
+        return
+    flags = os.O_RDONLY | getattr(os, "O_DIRECTORY", 0)
+    try:
+        dir_fd = os.open(parent, flags)
+    except FileNotFoundError:
+        # The directory was removed since, e.g. by the script's cleanup
+        parent.mkdir(parents=True, exist_ok=True)
+        dir_fd = os.open(parent, flags)
+    try:
+        for name, content in items:
+            fd = os.open(name, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644, dir_fd=dir_fd)
+            try:
+                view = memoryview(content)
+                while view:
+                    view = view[os.write(fd, view):]
+            finally:
+                os.close(fd)
+    finally:
+        os.close(dir_fd)
+
+
+def list_files(root):
+    """Relative paths (with / separators) of all files under root, in one walk"""
+    root = Path(root)
+    return {p.relative_to(root).as_posix() for p in root.rglob("*") if p.is_file()}
+
+
+def create_test_pair(safe_path, clean_path, content):
+    """
+    Helper to create the same file in both trees.
+    
+    The clean copy is a hard link to the safe copy where possible, so the
+    content is written only once. Deleting the clean copy just drops one
+    link and leaves the safe copy intact. Tests that modify one copy after
+    creating it must use create_test_file() for each copy instead.
+    """
+    create_test_file(safe_path, content)
+    ensure_parent(clean_path)
+    try:
+        os.link(safe_path, clean_path)
+    except OSError:
+        create_test_file(clean_path, content)
+
+
+_SESSION_ROOT = None
+_IO_POOL = None
+
+
+@contextmanager
+def scratch_dir(name):
+    """
+    Give a test its own empty directory.
+    
+    While the suite runs, this is a subdirectory of one session-wide
+    temporary directory that main() removes at the end, so tests don't each
+    pay for creating and deleting a temporary directory. Outside main() a
+    temporary directory of its own is used instead.
+    """
+    if _SESSION_ROOT is None:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            yield Path(tmpdir)
+    else:
+        yield Path(tempfile.mkdtemp(prefix=f"{name}_", dir=_SESSION_ROOT))
+
+
+def io_pool():
+    """Thread pool shared by all tests for creating many fixture files at once"""
+    global _IO_POOL
+    if _IO_POOL is None:
+        _IO_POOL = ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 4) * 4))
+    return _IO_POOL
+
+
 def run_script(*args, input_text=None):
-    """Helper to run the deduplicate script"""
-    result = subprocess.run(
-        [sys.executable, "deduplicate_trees.py"] + list(args),
-        input=input_text,
-        capture_output=True,
-        text=True
+    """
+    Helper to run the deduplicate script.
+    
+    The script is imported once and its main() called with the given
+    arguments, stdin and captured stdout/stderr, which is much faster than
+    a subprocess per run. Exit codes are taken from SystemExit, and an
+    uncaught exception gives exit code 1 with the traceback on stderr, as
+    it would from the command line. The result also has a stdout_lower
+    attribute holding the lower-cased stdout.
+    """
+    import deduplicate_trees
+    
+    stdout, stderr = io.StringIO(), io.StringIO()
+    saved_stdin = sys.stdin
+    sys.stdin = io.StringIO(input_text or "")
+    returncode = 0
+    try:
+        with redirect_stdout(stdout), redirect_stderr(stderr):
+            try:
+                deduplicate_trees.main(list(args))
+            except SystemExit as e:
+                if e.code is None:
+                    returncode = 0
+                elif isinstance(e.code, int):
+                    returncode = e.code
+                else:
+                    print(e.code, file=sys.stderr)
+                    returncode = 1
+            except Exception:
+                traceback.print_exc()
+                returncode = 1
+    finally:
+        sys.stdin = saved_stdin
+    result = subprocess.CompletedProcess(
+        ["deduplicate_trees.py"] + list(args), returncode,
+        stdout.getvalue(), stderr.getvalue()
     )
+    # Lower-cased once here for the many case-insensitive checks
+    result.stdout_lower = result.stdout.lower()
     return result
 
 
+def json_report(result):
+    """Parse the --report-json line (the last non-empty line of stdout), or {} if missing"""
+    lines = result.stdout.rstrip().rsplit("\n", 1)
+    try:
+        return json.loads(lines[-1])
+    except ValueError:
+        return {}
+
+
 def test_help_and_version():
     """Test that --help works"""
     test = TestCase("test_help_and_version")
     
     result = run_script("--help")
     test.assert_equal(result.returncode, 0, "Help exits with code 0")
-    test.assert_true("usage:" in result.stdout.lower(), "Help shows usage")
+    test.assert_true("usage:" in result.stdout_lower, "Help shows usage")
     test.assert_true("--dry-run" in result.stdout, "Help mentions --dry-run")
     test.assert_true("--verbose" in result.stdout, "Help mentions --verbose")
+    test.assert_true("--jobs" in result.stdout, "Help mentions --jobs")
+    test.assert_true("--algo" in result.stdout, "Help mentions --algo")
+    
+    return test.summary()
+
+
+def test_command_line_entry_point():
+    """Test the script as a separate process, since other tests call main() in-process"""
+    test = TestCase("test_command_line_entry_point")
+    script = Path(__file__).resolve().with_name("deduplicate_trees.py")
+    
+    with scratch_dir(test.name) as tmpdir:
+        safe_dir = tmpdir / "safe"
+        clean_dir = tmpdir / "clean"
+        create_test_pair(safe_dir / "dup.txt", clean_dir / "dup.txt", b"duplicate content")
+        
+        result = subprocess.run(
+            [sys.executable, str(script), str(safe_dir), str(clean_dir), "--dry-run"],
+            capture_output=True, text=True
+        )
+        test.assert_equal(result.returncode, 0, "Dry run exits with code 0")
+        test.assert_true("Found 1 duplicate" in result.stdout, "Dry run finds the duplicate")
+        
+        result = subprocess.run(
+            [sys.executable, str(script), str(tmpdir / "missing"), str(clean_dir), "--dry-run"],
+            capture_output=True, text=True
+        )
+        test.assert_equal(result.returncode, 1, "Missing path exits with code 1")
     
     return test.summary()
 
@@ -97,7 +331,7 @@ def test_nonexistent_paths():
     
     result = run_script("/nonexistent/path1", "/nonexistent/path2", "--dry-run")
     test.assert_true(result.returncode != 0, "Exits with error for non-existent paths")
-    test.assert_true("does not exist" in result.stdout.lower(), "Error message mentions path doesn't exist")
+    test.assert_true("does not exist" in result.stdout_lower, "Error message mentions path doesn't exist")
     
     return test.summary()
 
@@ -106,10 +340,10 @@ def test_same_directory_error():
     """Test that using same directory for both args is rejected"""
     test = TestCase("test_same_directory_error")
     
-    with tempfile.TemporaryDirectory() as tmpdir:
-        result = run_script(tmpdir, tmpdir, "--dry-run")
+    with scratch_dir(test.name) as tmpdir:
+        result = run_script(str(tmpdir), str(tmpdir), "--dry-run")
         test.assert_true(result.returncode != 0, "Exits with error for same directory")
-        test.assert_true("same directory" in result.stdout.lower(), "Error mentions same directory")
+        test.assert_true("same directory" in result.stdout_lower, "Error mentions same directory")
     
     return test.summary()
 
@@ -118,8 +352,7 @@ def test_empty_directories():
     """Test with empty directories"""
     test = TestCase("test_empty_directories")
     
-    with tempfile.TemporaryDirectory() as tmpdir:
-        tmpdir = Path(tmpdir)
+    with scratch_dir(test.name) as tmpdir:
         safe_dir = tmpdir / "safe"
         clean_dir = tmpdir / "clean"
         safe_dir.mkdir()
@@ -128,7 +361,7 @@ def test_empty_directories():
         result = run_script(str(safe_dir), str(clean_dir), "--dry-run")
         test.assert_equal(result.returncode, 0, "Handles empty directories")
         test.assert_true(
-            "0 duplicate" in result.stdout.lower() or "no duplicates" in result.stdout.lower(),
+            "0 duplicate" in result.stdout_lower or "no duplicates" in result.stdout_lower,
             "Reports no duplicates for empty dirs"
         )
     
@@ -139,8 +372,7 @@ def test_no_duplicates():
     """Test when there are no duplicates"""
     test = TestCase("test_no_duplicates")
     
-    with tempfile.TemporaryDirectory() as tmpdir:
-        tmpdir = Path(tmpdir)
+    with scratch_dir(test.name) as tmpdir:
         safe_dir = tmpdir / "safe"
         clean_dir = tmpdir / "clean"
         
@@ -148,12 +380,13 @@ def test_no_duplicates():
         create_test_file(safe_dir / "file1.txt", b"content A")
         create_test_file(clean_dir / "file2.txt", b"content B")
         
-        result = run_script(str(safe_dir), str(clean_dir), "--dry-run")
+        result = run_script(str(safe_dir), str(clean_dir), "--dry-run", "--report-json")
         test.assert_equal(result.returncode, 0, "Exits successfully")
         test.assert_true(
-            "0 duplicate" in result.stdout.lower() or "no duplicates" in result.stdout.lower(),
+            "0 duplicate" in result.stdout_lower or "no duplicates" in result.stdout_lower,
             "Reports no duplicates"
         )
+        test.assert_equal(json_report(result).get("would_delete"), 0, "JSON report shows nothing to delete")
         
         # Files should still exist
         test.assert_true((safe_dir / "file1.txt").exists(), "Safe file still exists")
@@ -166,32 +399,27 @@ def test_dry_run_preserves_files():
     """Test that dry-run doesn't actually delete files"""
     test = TestCase("test_dry_run_preserves_files")
     
-    with tempfile.TemporaryDirectory() as tmpdir:
-        tmpdir = Path(tmpdir)
+    with scratch_dir(test.name) as tmpdir:
         safe_dir = tmpdir / "safe"
         clean_dir = tmpdir / "clean"
         
         # Create identical files
-        create_test_file(safe_dir / "dup1.txt", b"duplicate content")
-        create_test_file(clean_dir / "dup1.txt", b"duplicate content")
-        create_test_file(safe_dir / "dup2.txt", b"another duplicate")
-        create_test_file(clean_dir / "dup2.txt", b"another duplicate")
+        create_test_pair(safe_dir / "dup1.txt", clean_dir / "dup1.txt", b"duplicate content")
+        create_test_pair(safe_dir / "dup2.txt", clean_dir / "dup2.txt", b"another duplicate")
         create_test_file(clean_dir / "unique.txt", b"unique content")
         
-        result = run_script(str(safe_dir), str(clean_dir), "--dry-run")
+        result = run_script(str(safe_dir), str(clean_dir), "--dry-run", "--report-json")
         
         test.assert_equal(result.returncode, 0, "Exits successfully")
         test.assert_true("DRY RUN" in result.stdout, "Output mentions DRY RUN")
-        test.assert_true("2" in result.stdout, "Output mentions 2 duplicates")
+        test.assert_equal(json_report(result).get("would_delete"), 2, "Output mentions 2 duplicates")
         
         # All files should still exist after dry run
-        test.assert_true((clean_dir / "dup1.txt").exists(), "dup1.txt still exists")
-        test.assert_true((clean_dir / "dup2.txt").exists(), "dup2.txt still exists")
-        test.assert_true((clean_dir / "unique.txt").exists(), "unique.txt still exists")
+        test.assert_set_equal(list_files(clean_dir), {"dup1.txt", "dup2.txt", "unique.txt"},
+                              "All clean files still exist")
         
         # Safe directory untouched
-        test.assert_true((safe_dir / "dup1.txt").exists(), "Safe dup1.txt exists")
-        test.assert_true((safe_dir / "dup2.txt").exists(), "Safe dup2.txt exists")
+        test.assert_set_equal(list_files(safe_dir), {"dup1.txt", "dup2.txt"}, "Safe files exist")
     
     return test.summary()
 
@@ -200,16 +428,13 @@ def test_actual_deletion():
     """Test that actual deletion works correctly"""
     test = TestCase("test_actual_deletion")
     
-    with tempfile.TemporaryDirectory() as tmpdir:
-        tmpdir = Path(tmpdir)
+    with scratch_dir(test.name) as tmpdir:
         safe_dir = tmpdir / "safe"
         clean_dir = tmpdir / "clean"
         
         # Create test structure
-        create_test_file(safe_dir / "dup1.txt", b"duplicate content")
-        create_test_file(clean_dir / "dup1.txt", b"duplicate content")
-        create_test_file(safe_dir / "subdir/dup2.txt", b"another duplicate")
-        create_test_file(clean_dir / "subdir/dup2.txt", b"another duplicate")
+        create_test_pair(safe_dir / "dup1.txt", clean_dir / "dup1.txt", b"duplicate content")
+        create_test_pair(safe_dir / "subdir/dup2.txt", clean_dir / "subdir/dup2.txt", b"another duplicate")
         create_test_file(clean_dir / "unique.txt", b"unique content")
         create_test_file(safe_dir / "safe_only.txt", b"safe content")
         
@@ -219,17 +444,13 @@ def test_actual_deletion():
         test.assert_equal(result.returncode, 0, "Exits successfully")
         test.assert_false("DRY RUN" in result.stdout, "Not a dry run")
         
-        # Duplicate files should be deleted
-        test.assert_false((clean_dir / "dup1.txt").exists(), "dup1.txt deleted")
-        test.assert_false((clean_dir / "subdir/dup2.txt").exists(), "dup2.txt deleted")
-        
-        # Unique file should be preserved
-        test.assert_true((clean_dir / "unique.txt").exists(), "unique.txt preserved")
+        # Duplicate files should be deleted, the unique file preserved
+        test.assert_set_equal(list_files(clean_dir), {"unique.txt"},
+                              "Duplicates deleted, unique.txt preserved")
         
         # Safe directory completely untouched
-        test.assert_true((safe_dir / "dup1.txt").exists(), "Safe dup1.txt preserved")
-        test.assert_true((safe_dir / "subdir/dup2.txt").exists(), "Safe dup2.txt preserved")
-        test.assert_true((safe_dir / "safe_only.txt").exists(), "Safe only file preserved")
+        test.assert_set_equal(list_files(safe_dir), {"dup1.txt", "subdir/dup2.txt", "safe_only.txt"},
+                              "Safe files preserved")
         
         # Empty subdirectory should be removed
         test.assert_false((clean_dir / "subdir").exists(), "Empty subdir removed")
@@ -237,18 +458,80 @@ def test_actual_deletion():
     return test.summary()
 
 
+def test_deletion_many_in_one_directory():
+    """Test deleting several duplicates from one directory, in more than one batch"""
+    test = TestCase("test_deletion_many_in_one_directory")
+    
+    with scratch_dir(test.name) as tmpdir:
+        safe_dir = tmpdir / "safe"
+        clean_dir = tmpdir / "clean"
+        
+        # A few duplicates sharing a directory, and more than the script's
+        # deletion batch size (64) in another
+        for i in range(3):
+            create_test_pair(safe_dir / f"few/dup{i}.txt", clean_dir / f"few/dup{i}.txt",
+                             f"few {i}".encode())
+        create_test_file(clean_dir / "few/unique.txt", b"unique content")
+        
+        num_many = 70
+        ensure_dir(safe_dir / "many")
+        ensure_dir(clean_dir / "many")
+        
+        def create_pair(i):
+            create_test_pair(safe_dir / f"many/dup{i}.txt", clean_dir / f"many/dup{i}.txt",
+                             f"many {i}".encode())
+        
+        list(io_pool().map(create_pair, range(num_many)))
+        create_test_file(safe_dir / "many/changed.txt", b"original")
+        create_test_file(clean_dir / "many/changed.txt", b"modified")
+        
+        result = run_script(str(safe_dir), str(clean_dir), "--report-json", input_text="yes\n")
+        
+        test.assert_equal(result.returncode, 0, "Exits successfully")
+        test.assert_set_equal(list_files(clean_dir), {"few/unique.txt", "many/changed.txt"},
+                              "All duplicates deleted, differing files preserved")
+        test.assert_true(f"Successfully deleted: {num_many + 3}" in result.stdout,
+                         "Reports every deletion as successful")
+        test.assert_equal(json_report(result).get("deleted"), num_many + 3, "JSON report counts every deletion")
+        test.assert_equal(len(list_files(safe_dir)), num_many + 4, "Safe files preserved")
+    
+    return test.summary()
+
+
+def test_nested_empty_directory_cleanup():
+    """Test that directories emptied by deletion are removed bottom-up"""
+    test = TestCase("test_nested_empty_directory_cleanup")
+    
+    with scratch_dir(test.name) as tmpdir:
+        safe_dir = tmpdir / "safe"
+        clean_dir = tmpdir / "clean"
+        
+        create_test_pair(safe_dir / "a/b/c/dup.txt", clean_dir / "a/b/c/dup.txt", b"duplicate content")
+        create_test_pair(safe_dir / "keep/x/dup.txt", clean_dir / "keep/x/dup.txt", b"another duplicate")
+        create_test_file(clean_dir / "keep/unique.txt", b"unique content")
+        
+        result = run_script(str(safe_dir), str(clean_dir), input_text="yes\n")
+        
+        test.assert_equal(result.returncode, 0, "Exits successfully")
+        test.assert_false((clean_dir / "a").exists(), "Whole chain of emptied directories removed")
+        test.assert_false((clean_dir / "keep/x").exists(), "Emptied subdirectory removed")
+        test.assert_true((clean_dir / "keep/unique.txt").exists(), "Directory with a remaining file kept")
+        test.assert_true(clean_dir.exists(), "Root of tree to clean kept")
+        test.assert_true("Removed 4 empty directories" in result.stdout, "Reports removed directories")
+    
+    return test.summary()
+
+
 def test_deletion_abort():
     """Test that answering 'no' to confirmation aborts deletion"""
     test = TestCase("test_deletion_abort")
     
-    with tempfile.TemporaryDirectory() as tmpdir:
-        tmpdir = Path(tmpdir)
+    with scratch_dir(test.name) as tmpdir:
         safe_dir = tmpdir / "safe"
         clean_dir = tmpdir / "clean"
         
         # Create identical files
-        create_test_file(safe_dir / "dup.txt", b"duplicate")
-        create_test_file(clean_dir / "dup.txt", b"duplicate")
+        create_test_pair(safe_dir / "dup.txt", clean_dir / "dup.txt", b"duplicate")
         
         # Run and answer 'no' to confirmation
         result = run_script(str(safe_dir), str(clean_dir), input_text="no\n")
@@ -266,8 +549,7 @@ def test_different_content_same_name():
     """Test that files with same name but different content are not deleted"""
     test = TestCase("test_different_content_same_name")
     
-    with tempfile.TemporaryDirectory() as tmpdir:
-        tmpdir = Path(tmpdir)
+    with scratch_dir(test.name) as tmpdir:
         safe_dir = tmpdir / "safe"
         clean_dir = tmpdir / "clean"
         
@@ -279,7 +561,7 @@ def test_different_content_same_name():
         
         test.assert_equal(result.returncode, 0, "Exits successfully")
         test.assert_true(
-            "0 duplicate" in result.stdout.lower() or "no duplicates" in result.stdout.lower(),
+            "0 duplicate" in result.stdout_lower or "no duplicates" in result.stdout_lower,
             "Reports no duplicates for different content"
         )
         test.assert_true((clean_dir / "file.txt").exists(), "Modified file preserved")
@@ -287,25 +569,46 @@ def test_different_content_same_name():
     return test.summary()
 
 
+def test_same_size_different_tail():
+    """Test that same-size files that only differ after the first few KB are not deleted"""
+    test = TestCase("test_same_size_different_tail")
+    
+    with scratch_dir(test.name) as tmpdir:
+        safe_dir = tmpdir / "safe"
+        clean_dir = tmpdir / "clean"
+        
+        prefix = b"p" * 16384
+        create_test_file(safe_dir / "file.bin", prefix + b"original")
+        create_test_file(clean_dir / "file.bin", prefix + b"modified")
+        
+        result = run_script(str(safe_dir), str(clean_dir), input_text="yes\n")
+        
+        test.assert_equal(result.returncode, 0, "Exits successfully")
+        test.assert_true(
+            "0 duplicate" in result.stdout_lower or "no duplicates" in result.stdout_lower,
+            "Reports no duplicates for files differing past the head"
+        )
+        test.assert_true((clean_dir / "file.bin").exists(), "Modified file preserved")
+    
+    return test.summary()
+
+
 def test_nested_directories():
     """Test handling of nested directory structures"""
     test = TestCase("test_nested_directories")
     
-    with tempfile.TemporaryDirectory() as tmpdir:
-        tmpdir = Path(tmpdir)
+    with scratch_dir(test.name) as tmpdir:
         safe_dir = tmpdir / "safe"
         clean_dir = tmpdir / "clean"
         
         # Create nested structure with duplicates
-        create_test_file(safe_dir / "a/b/c/deep.txt", b"deep file")
-        create_test_file(clean_dir / "a/b/c/deep.txt", b"deep file")
-        create_test_file(safe_dir / "x/y/file.txt", b"another")
-        create_test_file(clean_dir / "x/y/file.txt", b"another")
+        create_test_pair(safe_dir / "a/b/c/deep.txt", clean_dir / "a/b/c/deep.txt", b"deep file")
+        create_test_pair(safe_dir / "x/y/file.txt", clean_dir / "x/y/file.txt", b"another")
         
-        result = run_script(str(safe_dir), str(clean_dir), "--dry-run")
+        result = run_script(str(safe_dir), str(clean_dir), "--dry-run", "--report-json")
         
         test.assert_equal(result.returncode, 0, "Handles nested directories")
-        test.assert_true("2" in result.stdout, "Finds 2 duplicates in nested structure")
+        test.assert_equal(json_report(result).get("would_delete"), 2, "Finds 2 duplicates in nested structure")
     
     return test.summary()
 
@@ -314,13 +617,11 @@ def test_verbose_mode():
     """Test that verbose mode produces more output"""
     test = TestCase("test_verbose_mode")
     
-    with tempfile.TemporaryDirectory() as tmpdir:
-        tmpdir = Path(tmpdir)
+    with scratch_dir(test.name) as tmpdir:
         safe_dir = tmpdir / "safe"
         clean_dir = tmpdir / "clean"
         
-        create_test_file(safe_dir / "file.txt", b"content")
-        create_test_file(clean_dir / "file.txt", b"content")
+        create_test_pair(safe_dir / "file.txt", clean_dir / "file.txt", b"content")
         
         # Run without verbose
         result_normal = run_script(str(safe_dir), str(clean_dir), "--dry-run")
@@ -341,23 +642,19 @@ def test_special_characters_in_filenames():
     """Test handling of filenames with spaces and special characters"""
     test = TestCase("test_special_characters_in_filenames")
     
-    with tempfile.TemporaryDirectory() as tmpdir:
-        tmpdir = Path(tmpdir)
+    with scratch_dir(test.name) as tmpdir:
         safe_dir = tmpdir / "safe"
         clean_dir = tmpdir / "clean"
         
         # Create files with special characters (Windows-compatible)
-        create_test_file(safe_dir / "file with spaces.txt", b"content")
-        create_test_file(clean_dir / "file with spaces.txt", b"content")
-        create_test_file(safe_dir / "file-with-dashes.txt", b"more content")
-        create_test_file(clean_dir / "file-with-dashes.txt", b"more content")
-        create_test_file(safe_dir / "file_underscores_123.txt", b"numbers")
-        create_test_file(clean_dir / "file_underscores_123.txt", b"numbers")
+        create_test_pair(safe_dir / "file with spaces.txt", clean_dir / "file with spaces.txt", b"content")
+        create_test_pair(safe_dir / "file-with-dashes.txt", clean_dir / "file-with-dashes.txt", b"more content")
+        create_test_pair(safe_dir / "file_underscores_123.txt", clean_dir / "file_underscores_123.txt", b"numbers")
         
-        result = run_script(str(safe_dir), str(clean_dir), "--dry-run")
+        result = run_script(str(safe_dir), str(clean_dir), "--dry-run", "--report-json")
         
         test.assert_equal(result.returncode, 0, "Handles special characters in filenames")
-        test.assert_true("3" in result.stdout, "Finds 3 duplicates with special chars")
+        test.assert_equal(json_report(result).get("would_delete"), 3, "Finds 3 duplicates with special chars")
     
     return test.summary()
 
@@ -366,8 +663,7 @@ def test_binary_files():
     """Test handling of binary files (images, executables, etc.)"""
     test = TestCase("test_binary_files")
     
-    with tempfile.TemporaryDirectory() as tmpdir:
-        tmpdir = Path(tmpdir)
+    with scratch_dir(test.name) as tmpdir:
         safe_dir = tmpdir / "safe"
         clean_dir = tmpdir / "clean"
         
@@ -375,15 +671,13 @@ def test_binary_files():
         binary_data1 = bytes([0x00, 0xFF, 0x42, 0x13, 0x37] * 100)
         binary_data2 = bytes(range(256)) * 10
         
-        create_test_file(safe_dir / "binary1.bin", binary_data1)
-        create_test_file(clean_dir / "binary1.bin", binary_data1)
-        create_test_file(safe_dir / "binary2.dat", binary_data2)
-        create_test_file(clean_dir / "binary2.dat", binary_data2)
+        create_test_pair(safe_dir / "binary1.bin", clean_dir / "binary1.bin", binary_data1)
+        create_test_pair(safe_dir / "binary2.dat", clean_dir / "binary2.dat", binary_data2)
         
-        result = run_script(str(safe_dir), str(clean_dir), "--dry-run")
+        result = run_script(str(safe_dir), str(clean_dir), "--dry-run", "--report-json")
         
         test.assert_equal(result.returncode, 0, "Handles binary files")
-        test.assert_true("2" in result.stdout, "Finds 2 duplicate binary files")
+        test.assert_equal(json_report(result).get("would_delete"), 2, "Finds 2 duplicate binary files")
     
     return test.summary()
 
@@ -392,21 +686,24 @@ def test_zero_byte_files():
     """Test handling of empty (zero-byte) files"""
     test = TestCase("test_zero_byte_files")
     
-    with tempfile.TemporaryDirectory() as tmpdir:
-        tmpdir = Path(tmpdir)
+    with scratch_dir(test.name) as tmpdir:
         safe_dir = tmpdir / "safe"
         clean_dir = tmpdir / "clean"
         
         # Create multiple empty files
-        create_test_file(safe_dir / "empty1.txt", b"")
-        create_test_file(clean_dir / "empty1.txt", b"")
-        create_test_file(safe_dir / "empty2.txt", b"")
-        create_test_file(clean_dir / "empty2.txt", b"")
+        create_test_pair(safe_dir / "empty1.txt", clean_dir / "empty1.txt", b"")
+        create_test_pair(safe_dir / "empty2.txt", clean_dir / "empty2.txt", b"")
         
-        result = run_script(str(safe_dir), str(clean_dir), "--dry-run")
+        result = run_script(str(safe_dir), str(clean_dir), "--dry-run", "--report-json")
         
         test.assert_equal(result.returncode, 0, "Handles zero-byte files")
-        test.assert_true("2" in result.stdout, "Finds 2 duplicate empty files")
+        test.assert_equal(json_report(result).get("would_delete"), 2, "Finds 2 duplicate empty files")
+        
+        result = run_script(str(safe_dir), str(clean_dir), "--dry-run", "--algo", "sha256")
+        test.assert_true(
+            f"[SHA256]:{hashlib.sha256(b'').hexdigest()}" in result.stdout,
+            "Shows the checksum of empty content"
+        )
     
     return test.summary()
 
@@ -415,22 +712,30 @@ def test_large_files():
     """Test handling of larger files (10MB+)"""
     test = TestCase("test_large_files")
     
-    with tempfile.TemporaryDirectory() as tmpdir:
-        tmpdir = Path(tmpdir)
+    with scratch_dir(test.name) as tmpdir:
         safe_dir = tmpdir / "safe"
         clean_dir = tmpdir / "clean"
         
-        # Create 10MB files
-        large_data = b"x" * (10 * 1024 * 1024)
-        
-        create_test_file(safe_dir / "large.bin", large_data)
-        create_test_file(clean_dir / "large.bin", large_data)
+        # Create 10MB files: sparse where the filesystem supports it, with
+        # a non-zero tail so the contents are not all holes
+        large_size = 10 * 1024 * 1024
+        tail = b"large file tail"
+        safe_file = safe_dir / "large.bin"
+        safe_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(safe_file, 'wb') as f:
+            f.truncate(large_size - len(tail))
+            f.seek(0, os.SEEK_END)
+            f.write(tail)
+        clean_dir.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(safe_file, clean_dir / "large.bin")
         
-        result = run_script(str(safe_dir), str(clean_dir), "--dry-run")
+        result = run_script(str(safe_dir), str(clean_dir), "--dry-run", "--report-json")
         
         test.assert_equal(result.returncode, 0, "Handles large files")
-        test.assert_true("1" in result.stdout, "Finds 1 duplicate large file")
-        test.assert_true("10" in result.stdout or "MB" in result.stdout, "Shows file size")
+        report = json_report(result)
+        test.assert_equal(report.get("would_delete"), 1, "Finds 1 duplicate large file")
+        test.assert_equal(report.get("bytes"), large_size, "Reports the file size")
+        test.assert_true("10.00 MB" in result.stdout, "Shows file size")
     
     return test.summary()
 
@@ -439,8 +744,7 @@ def test_different_paths_same_content():
     """Test that files in different relative paths are NOT deleted even if content matches"""
     test = TestCase("test_different_paths_same_content")
     
-    with tempfile.TemporaryDirectory() as tmpdir:
-        tmpdir = Path(tmpdir)
+    with scratch_dir(test.name) as tmpdir:
         safe_dir = tmpdir / "safe"
         clean_dir = tmpdir / "clean"
         
@@ -452,7 +756,7 @@ def test_different_paths_same_content():
         
         test.assert_equal(result.returncode, 0, "Exits successfully")
         test.assert_true(
-            "0 duplicate" in result.stdout.lower() or "no duplicates" in result.stdout.lower(),
+            "0 duplicate" in result.stdout_lower or "no duplicates" in result.stdout_lower,
             "Does not delete files in different paths"
         )
         test.assert_true((clean_dir / "dirB/file.txt").exists(), "File in different path preserved")
@@ -464,27 +768,26 @@ def test_partial_directory_overlap():
     """Test when directories partially overlap (some files match, some don't)"""
     test = TestCase("test_partial_directory_overlap")
     
-    with tempfile.TemporaryDirectory() as tmpdir:
-        tmpdir = Path(tmpdir)
+    with scratch_dir(test.name) as tmpdir:
         safe_dir = tmpdir / "safe"
         clean_dir = tmpdir / "clean"
         
         # Create partial overlap
-        create_test_file(safe_dir / "subdir/file1.txt", b"content1")
-        create_test_file(clean_dir / "subdir/file1.txt", b"content1")  # duplicate
-        create_test_file(safe_dir / "subdir/file2.txt", b"content2")
-        create_test_file(clean_dir / "subdir/file2.txt", b"modified2")  # different
-        create_test_file(clean_dir / "subdir/file3.txt", b"content3")  # only in clean
+        create_test_files(safe_dir / "subdir", [("file1.txt", b"content1"),
+                                                ("file2.txt", b"content2")])
+        create_test_files(clean_dir / "subdir", [("file1.txt", b"content1"),    # duplicate
+                                                 ("file2.txt", b"modified2"),   # different
+                                                 ("file3.txt", b"content3")])   # only in clean
         
-        result = run_script(str(safe_dir), str(clean_dir), "--dry-run")
+        result = run_script(str(safe_dir), str(clean_dir), "--dry-run", "--report-json")
         
         test.assert_equal(result.returncode, 0, "Handles partial overlap")
-        test.assert_true("1" in result.stdout, "Finds 1 duplicate in partial overlap")
+        test.assert_equal(json_report(result).get("would_delete"), 1, "Finds 1 duplicate in partial overlap")
         
         # Verify files still exist (dry run)
-        test.assert_true((clean_dir / "subdir/file1.txt").exists(), "Duplicate still exists in dry run")
-        test.assert_true((clean_dir / "subdir/file2.txt").exists(), "Modified file exists")
-        test.assert_true((clean_dir / "subdir/file3.txt").exists(), "Unique file exists")
+        test.assert_set_equal(list_files(clean_dir),
+                              {"subdir/file1.txt", "subdir/file2.txt", "subdir/file3.txt"},
+                              "Duplicate, modified and unique files still exist in dry run")
     
     return test.summary()
 
@@ -493,29 +796,27 @@ def test_files_only_in_safe_directory():
     """Test that files only in safe directory are ignored"""
     test = TestCase("test_files_only_in_safe_directory")
     
-    with tempfile.TemporaryDirectory() as tmpdir:
-        tmpdir = Path(tmpdir)
+    with scratch_dir(test.name) as tmpdir:
         safe_dir = tmpdir / "safe"
         clean_dir = tmpdir / "clean"
         
         # Files only in safe
-        create_test_file(safe_dir / "safe_only1.txt", b"content1")
-        create_test_file(safe_dir / "safe_only2.txt", b"content2")
+        create_test_files(safe_dir, [("safe_only1.txt", b"content1"),
+                                     ("safe_only2.txt", b"content2")])
         create_test_file(safe_dir / "subdir/safe_only3.txt", b"content3")
         
         # One file in both
-        create_test_file(safe_dir / "both.txt", b"shared")
-        create_test_file(clean_dir / "both.txt", b"shared")
+        create_test_pair(safe_dir / "both.txt", clean_dir / "both.txt", b"shared")
         
-        result = run_script(str(safe_dir), str(clean_dir), "--dry-run")
+        result = run_script(str(safe_dir), str(clean_dir), "--dry-run", "--report-json")
         
         test.assert_equal(result.returncode, 0, "Handles safe-only files")
-        test.assert_true("1" in result.stdout, "Finds only 1 duplicate (shared file)")
+        test.assert_equal(json_report(result).get("would_delete"), 1, "Finds only 1 duplicate (shared file)")
         
         # Safe directory should be completely untouched
-        test.assert_true((safe_dir / "safe_only1.txt").exists(), "Safe-only file 1 exists")
-        test.assert_true((safe_dir / "safe_only2.txt").exists(), "Safe-only file 2 exists")
-        test.assert_true((safe_dir / "subdir/safe_only3.txt").exists(), "Safe-only file 3 exists")
+        test.assert_set_equal(list_files(safe_dir),
+                              {"safe_only1.txt", "safe_only2.txt", "subdir/safe_only3.txt", "both.txt"},
+                              "Safe-only files exist")
     
     return test.summary()
 
@@ -524,22 +825,25 @@ def test_many_files():
     """Test with a larger number of files (performance/scalability check)"""
     test = TestCase("test_many_files")
     
-    with tempfile.TemporaryDirectory() as tmpdir:
-        tmpdir = Path(tmpdir)
+    with scratch_dir(test.name) as tmpdir:
         safe_dir = tmpdir / "safe"
         clean_dir = tmpdir / "clean"
         
-        # Create 100 duplicate files
+        # Create 100 duplicate files, overlapping the file system calls
         num_files = 100
-        for i in range(num_files):
+        safe_dir.mkdir()
+        clean_dir.mkdir()
+        
+        def create_pair(i):
             content = f"file content {i}".encode()
-            create_test_file(safe_dir / f"file_{i}.txt", content)
-            create_test_file(clean_dir / f"file_{i}.txt", content)
+            create_test_pair(safe_dir / f"file_{i}.txt", clean_dir / f"file_{i}.txt", content)
         
-        result = run_script(str(safe_dir), str(clean_dir), "--dry-run")
+        list(io_pool().map(create_pair, range(num_files)))
+        
+        result = run_script(str(safe_dir), str(clean_dir), "--dry-run", "--report-json")
         
         test.assert_equal(result.returncode, 0, "Handles many files")
-        test.assert_true(str(num_files) in result.stdout, f"Finds {num_files} duplicates")
+        test.assert_equal(json_report(result).get("would_delete"), num_files, f"Finds {num_files} duplicates")
     
     return test.summary()
 
@@ -548,8 +852,7 @@ def test_readonly_file_in_safe():
     """Test that read-only files in safe directory work correctly"""
     test = TestCase("test_readonly_file_in_safe")
     
-    with tempfile.TemporaryDirectory() as tmpdir:
-        tmpdir = Path(tmpdir)
+    with scratch_dir(test.name) as tmpdir:
         safe_dir = tmpdir / "safe"
         clean_dir = tmpdir / "clean"
         
@@ -562,10 +865,11 @@ def test_readonly_file_in_safe():
         safe_file.chmod(0o444)
         
         try:
-            result = run_script(str(safe_dir), str(clean_dir), "--dry-run")
+            result = run_script(str(safe_dir), str(clean_dir), "--dry-run", "--report-json")
             
             test.assert_equal(result.returncode, 0, "Handles read-only files in safe dir")
-            test.assert_true("1" in result.stdout, "Finds duplicate with read-only safe file")
+            test.assert_equal(json_report(result).get("would_delete"), 1,
+                              "Finds duplicate with read-only safe file")
         finally:
             # Restore permissions for cleanup
             safe_file.chmod(0o644)
@@ -573,77 +877,505 @@ def test_readonly_file_in_safe():
     return test.summary()
 
 
-def main():
-    print("=" * 70)
-    print("Running Black-Box Test Suite for deduplicate_trees.py")
-    print("=" * 70)
-    print()
-    
-    all_passed = True
-    
-    all_passed &= test_help_and_version()
-    print()
+def test_jobs_option():
+    """Test that --jobs controls hashing parallelism and rejects bad values"""
+    test = TestCase("test_jobs_option")
     
-    all_passed &= test_missing_arguments()
-    print()
+    with scratch_dir(test.name) as tmpdir:
+        safe_dir = tmpdir / "safe"
+        clean_dir = tmpdir / "clean"
+        
+        for i in range(5):
+            content = f"jobs content {i}".encode()
+            create_test_pair(safe_dir / f"file_{i}.txt", clean_dir / f"file_{i}.txt", content)
+        
+        result = run_script(str(safe_dir), str(clean_dir), "--dry-run", "--jobs", "1")
+        test.assert_equal(result.returncode, 0, "Single-threaded run exits successfully")
+        test.assert_true("Found 5 duplicate" in result.stdout, "Single-threaded run finds 5 duplicates")
+        
+        result = run_script(str(safe_dir), str(clean_dir), "--dry-run", "--jobs", "4")
+        test.assert_equal(result.returncode, 0, "Multi-threaded run exits successfully")
+        test.assert_true("Found 5 duplicate" in result.stdout, "Multi-threaded run finds 5 duplicates")
+        
+        result = run_script(str(safe_dir), str(clean_dir), "--dry-run", "--jobs", "0")
+        test.assert_true(result.returncode != 0, "Exits with error for --jobs 0")
     
-    all_passed &= test_nonexistent_paths()
-    print()
+    return test.summary()
+
+
+def test_serial_verify():
+    """Test that concurrent and serial reads of multi-chunk files agree"""
+    test = TestCase("test_serial_verify")
     
-    all_passed &= test_same_directory_error()
-    print()
+    with scratch_dir(test.name) as tmpdir:
+        safe_dir = tmpdir / "safe"
+        clean_dir = tmpdir / "clean"
+        
+        # A few MB, so the files are read in several chunks
+        data = os.urandom(3 * 1024 * 1024 + 123)
+        create_test_pair(safe_dir / "same.bin", clean_dir / "same.bin", data)
+        create_test_file(safe_dir / "tail.bin", data)
+        create_test_file(clean_dir / "tail.bin", data[:-1] + b"\0")
+        
+        for extra in ([], ["--serial-verify"]):
+            label = " ".join(extra) or "concurrent reads"
+            result = run_script(str(safe_dir), str(clean_dir), "--dry-run", *extra)
+            test.assert_equal(result.returncode, 0, f"Exits successfully ({label})")
+            test.assert_true("Found 1 duplicate" in result.stdout, f"Finds only the identical file ({label})")
+            test.assert_false("tail.bin" in result.stdout, f"File differing in last chunk kept ({label})")
     
-    all_passed &= test_empty_directories()
-    print()
+    return test.summary()
+
+
+def test_algo_option():
+    """Test that --algo selects the checksum shown for each duplicate"""
+    test = TestCase("test_algo_option")
     
-    all_passed &= test_no_duplicates()
-    print()
+    with scratch_dir(test.name) as tmpdir:
+        safe_dir = tmpdir / "safe"
+        clean_dir = tmpdir / "clean"
+        
+        content = b"algorithm content"
+        create_test_pair(safe_dir / "file.txt", clean_dir / "file.txt", content)
+        
+        result = run_script(str(safe_dir), str(clean_dir), "--dry-run", "--algo", "sha256")
+        test.assert_equal(result.returncode, 0, "SHA256 run exits successfully")
+        test.assert_true(
+            f"[SHA256]:{hashlib.sha256(content).hexdigest()}" in result.stdout,
+            "SHA256 checksum is shown"
+        )
+        
+        # BLAKE3 is optional; without the package the script must refuse cleanly
+        result = run_script(str(safe_dir), str(clean_dir), "--dry-run", "--algo", "blake3")
+        if result.returncode == 0:
+            test.assert_true("[BLAKE3]:" in result.stdout, "BLAKE3 checksum is shown")
+        else:
+            test.assert_true("blake3" in result.stdout, "Error mentions the blake3 package")
+        
+        # Likewise XXH3 needs the optional xxhash package
+        result = run_script(str(safe_dir), str(clean_dir), "--dry-run", "--algo", "xxh3")
+        if result.returncode == 0:
+            test.assert_true("[XXH3]:" in result.stdout, "XXH3 checksum is shown")
+        else:
+            test.assert_true("xxhash" in result.stdout, "Error mentions the xxhash package")
+        
+        result = run_script(str(safe_dir), str(clean_dir), "--dry-run", "--algo", "md5")
+        test.assert_true(result.returncode != 0, "Exits with error for unknown algorithm")
     
-    all_passed &= test_dry_run_preserves_files()
-    print()
+    return test.summary()
+
+
+def test_hash_cache():
+    """Test that --hash-cache persists checksums and notices modified files"""
+    test = TestCase("test_hash_cache")
     
-    all_passed &= test_actual_deletion()
-    print()
+    with scratch_dir(test.name) as tmpdir:
+        safe_dir = tmpdir / "safe"
+        clean_dir = tmpdir / "clean"
+        cache_file = tmpdir / "cache.sqlite"
+        
+        prefix = b"c" * 8192
+        create_test_file(safe_dir / "dup.txt", prefix + b"cached content")
+        create_test_file(clean_dir / "dup.txt", prefix + b"cached content")
+        
+        result = run_script(str(safe_dir), str(clean_dir), "--dry-run",
+                            "--hash-cache", str(cache_file))
+        test.assert_equal(result.returncode, 0, "First run exits successfully")
+        test.assert_true("Found 1 duplicate" in result.stdout, "First run finds the duplicate")
+        test.assert_true(cache_file.exists(), "Cache file created")
+        
+        result = run_script(str(safe_dir), str(clean_dir), "--dry-run", "--verbose",
+                            "--hash-cache", str(cache_file))
+        test.assert_true("Found 1 duplicate" in result.stdout, "Cached run finds the duplicate")
+        test.assert_true("Hash cache hits: 2" in result.stdout, "Cached run reuses both checksums")
+        
+        # Same size and head, different content and modification time
+        clean_file = clean_dir / "dup.txt"
+        create_test_file(clean_file, prefix + b"cached CONTENT")
+        st = clean_file.stat()
+        os.utime(clean_file, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        
+        result = run_script(str(safe_dir), str(clean_dir), "--dry-run",
+                            "--hash-cache", str(cache_file))
+        test.assert_true(
+            "0 duplicate" in result.stdout_lower or "no duplicates" in result.stdout_lower,
+            "Modified file is re-hashed, not matched from cache"
+        )
+        
+        # A path that can't be a database is rejected before the prompt
+        result = run_script(str(safe_dir), str(clean_dir), "--hash-cache", str(safe_dir))
+        test.assert_equal(result.returncode, 1, "Unusable cache path exits with code 1")
+        test.assert_true("Could not open hash cache" in result.stdout, "Error names the hash cache")
+        test.assert_false("Are you sure" in result.stdout, "Error comes before the deletion prompt")
+        
+        # Cache a match, then change the content but put the old
+        # modification time back, as cp -p or rsync -t would. The new
+        # change time invalidates the entry; on Windows, where st_ctime is
+        # the unchanged creation time, the files are compared instead
+        create_test_file(clean_file, prefix + b"cached content")
+        result = run_script(str(safe_dir), str(clean_dir), "--dry-run",
+                            "--hash-cache", str(cache_file))
+        test.assert_true("Found 1 duplicate" in result.stdout, "Restored file matches again")
+        st = clean_file.stat()
+        time.sleep(0.02)  # let the coarse file timestamp clock tick
+        create_test_file(clean_file, prefix + b"cached CONTENT")
+        os.utime(clean_file, ns=(st.st_atime_ns, st.st_mtime_ns))
+        
+        result = run_script(str(safe_dir), str(clean_dir), "--dry-run",
+                            "--hash-cache", str(cache_file))
+        test.assert_true(
+            "0 duplicate" in result.stdout_lower or "no duplicates" in result.stdout_lower,
+            "File with restored modification time is re-hashed, not matched from cache"
+        )
     
-    all_passed &= test_deletion_abort()
-    print()
+    return test.summary()
+
+
+def test_hash_cache_one_side_cached():
+    """Test a large file matched against a cached checksum of its counterpart"""
+    test = TestCase("test_hash_cache_one_side_cached")
     
-    all_passed &= test_different_content_same_name()
-    print()
+    with scratch_dir(test.name) as tmpdir:
+        safe_dir = tmpdir / "safe"
+        clean_dir = tmpdir / "clean"
+        cache_file = tmpdir / "cache.sqlite"
+        
+        # Above the 1MB memory-mapping threshold, with a distinct tail
+        content = bytes(range(256)) * 8192 + b"large cached tail"
+        create_test_file(safe_dir / "big.bin", content)
+        create_test_file(clean_dir / "big.bin", content)
+        
+        args = (str(safe_dir), str(clean_dir), "--dry-run", "--verbose", "--report-json",
+                "--algo", "sha256", "--hash-cache", str(cache_file))
+        result = run_script(*args)
+        test.assert_equal(json_report(result).get("would_delete"), 1, "First run finds the duplicate")
+        
+        # A new file (new inode) with the same content: only the safe
+        # copy's checksum is cached, so the clean copy is hashed on its own
+        (clean_dir / "big.bin").unlink()
+        create_test_file(clean_dir / "big.bin", content)
+        result = run_script(*args)
+        test.assert_true("Hash cache hits: 1" in result.stdout, "Safe copy's checksum comes from the cache")
+        test.assert_equal(json_report(result).get("would_delete"), 1, "Hashed copy matches the cached one")
+        test.assert_true(
+            f"[SHA256]:{hashlib.sha256(content).hexdigest()}" in result.stdout,
+            "Shows the checksum of the large file"
+        )
     
-    all_passed &= test_nested_directories()
-    print()
+    return test.summary()
+
+
+class _CollidingXXH3:
+    """Stand-in for xxhash.xxh3_128 that gives every input the same digest"""
     
-    all_passed &= test_verbose_mode()
-    print()
+    def __init__(self, data=b""):
+        pass
     
-    all_passed &= test_special_characters_in_filenames()
-    print()
+    def update(self, data):
+        pass
     
-    all_passed &= test_binary_files()
-    print()
+    def digest(self):
+        return bytes(16)
+
+
+def test_xxh3_cache_never_proves_a_match():
+    """Test that cached XXH3 digests alone never get a different file deleted"""
+    test = TestCase("test_xxh3_cache_never_proves_a_match")
+    
+    # XXH3 collisions can be constructed; make every file collide. The
+    # module run_script() calls is swapped in place, and only in this process
+    import deduplicate_trees
+    saved_xxhash = deduplicate_trees.xxhash
+    deduplicate_trees.xxhash = types.SimpleNamespace(xxh3_128=_CollidingXXH3)
+    
+    try:
+        with scratch_dir(test.name) as tmpdir:
+            cache_file = tmpdir / "cache.sqlite"
+            content_a = b"A" * 5000
+            content_b = b"A" * 4999 + b"B"
+            
+            # Cache safe/f.bin (content A) and clean/f.bin (content B)
+            # through pairs with identical copies of each
+            for root, content in (("safe", content_a), ("ref_a", content_a),
+                                  ("ref_b", content_b), ("clean", content_b),
+                                  ("clean2", content_b)):
+                create_test_file(tmpdir / root / "f.bin", content)
+            
+            def run(safe, clean):
+                return run_script(str(tmpdir / safe), str(tmpdir / clean), "--dry-run",
+                                  "--verbose", "--report-json", "--algo", "xxh3",
+                                  "--hash-cache", str(cache_file))
+            
+            result = run("safe", "ref_a")
+            test.assert_equal(json_report(result).get("would_delete"), 1, "Identical pair matches")
+            run("ref_b", "clean")
+            
+            result = run("safe", "clean")
+            test.assert_true("Hash cache hits: 2" in result.stdout, "Both colliding digests are cached")
+            test.assert_equal(json_report(result).get("would_delete"), 0,
+                              "Different file with both digests cached is kept")
+            
+            result = run("safe", "clean2")
+            test.assert_equal(json_report(result).get("would_delete"), 0,
+                              "Different file with one digest cached is kept")
+            
+            result = run("safe", "ref_a")
+            test.assert_equal(json_report(result).get("would_delete"), 1,
+                              "Cached identical pair still matches")
+    finally:
+        deduplicate_trees.xxhash = saved_xxhash
     
-    all_passed &= test_zero_byte_files()
-    print()
+    return test.summary()
+
+
+def test_symlinks_skipped():
+    """Test that symbolic links in the tree to clean are never deleted"""
+    test = TestCase("test_symlinks_skipped")
     
-    all_passed &= test_large_files()
-    print()
+    with scratch_dir(test.name) as tmpdir:
+        safe_dir = tmpdir / "safe"
+        clean_dir = tmpdir / "clean"
+        
+        create_test_file(safe_dir / "link.txt", b"linked content")
+        create_test_file(tmpdir / "target.txt", b"linked content")
+        clean_dir.mkdir()
+        
+        try:
+            os.symlink(tmpdir / "target.txt", clean_dir / "link.txt")
+        except (OSError, NotImplementedError):
+            print("  [SKIP] Symbolic links not supported here")
+            return test.summary()
+        
+        result = run_script(str(safe_dir), str(clean_dir), input_text="yes\n")
+        
+        test.assert_equal(result.returncode, 0, "Exits successfully")
+        test.assert_true(
+            "0 duplicate" in result.stdout_lower or "no duplicates" in result.stdout_lower,
+            "Symlink is not reported as a duplicate"
+        )
+        test.assert_true(os.path.islink(clean_dir / "link.txt"), "Symlink preserved")
+        test.assert_true((tmpdir / "target.txt").exists(), "Symlink target preserved")
     
-    all_passed &= test_different_paths_same_content()
-    print()
+    return test.summary()
+
+
+def use_ram_temp_dir():
+    """
+    Put test trees on a RAM-backed file system where one is available.
+    
+    DEDUP_TESTS_TMPDIR overrides the location (set it to an empty string to
+    keep the default temporary directory); otherwise /dev/shm is used on
+    Linux. Every tempfile.TemporaryDirectory() created afterwards uses it.
+    """
+    tmpdir = os.environ.get("DEDUP_TESTS_TMPDIR")
+    if tmpdir is None and sys.platform.startswith("linux") and os.path.isdir("/dev/shm") \
+            and os.access("/dev/shm", os.W_OK):
+        tmpdir = "/dev/shm"
+    if tmpdir:
+        tempfile.tempdir = tmpdir
+
+
+# Tests run in this order; results are printed in this order too
+TESTS = [
+    test_help_and_version,
+    test_command_line_entry_point,
+    test_missing_arguments,
+    test_nonexistent_paths,
+    test_same_directory_error,
+    test_empty_directories,
+    test_no_duplicates,
+    test_dry_run_preserves_files,
+    test_actual_deletion,
+    test_deletion_many_in_one_directory,
+    test_nested_empty_directory_cleanup,
+    test_deletion_abort,
+    test_different_content_same_name,
+    test_same_size_different_tail,
+    test_nested_directories,
+    test_verbose_mode,
+    test_special_characters_in_filenames,
+    test_binary_files,
+    test_zero_byte_files,
+    test_large_files,
+    test_different_paths_same_content,
+    test_partial_directory_overlap,
+    test_files_only_in_safe_directory,
+    test_many_files,
+    test_readonly_file_in_safe,
+    test_jobs_option,
+    test_serial_verify,
+    test_symlinks_skipped,
+    test_algo_option,
+    test_hash_cache,
+    test_hash_cache_one_side_cached,
+    test_xxh3_cache_never_proves_a_match,
+]
+
+
+RESULT_CACHE = Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") \
+    / "deduplicate_trees_tests.json"
+
+
+def source_key():
+    """
+    Fingerprint of everything the test results depend on: this file, the
+    script under test, the Python version, which optional hash packages
+    are installed, the platform, and the temporary directory the test trees
+    are created in (hard links, sparse files, symlinks and timestamps all
+    depend on its filesystem).
+    """
+    here = Path(__file__).resolve().parent
+    h = hashlib.sha256()
+    for name in ("deduplicate_trees.py", "test_deduplicate_trees.py"):
+        h.update((here / name).read_bytes())
+    h.update(sys.version.encode())
+    for package in ("blake3", "xxhash"):
+        h.update(package.encode() if importlib.util.find_spec(package) else b"-")
+    h.update(sys.platform.encode())
+    h.update(os.path.realpath(tempfile.gettempdir()).encode())
+    return h.hexdigest()
+
+
+def load_passed_tests(key):
+    """Names of tests that passed on the last run with the same source key"""
+    try:
+        with open(RESULT_CACHE) as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return set()
+    if not isinstance(cached, dict) or cached.get("key") != key:
+        return set()
+    return set(cached.get("passed", []))
+
+
+def save_passed_tests(key, passed):
+    """Remember which tests passed; failures to write the cache are ignored"""
+    try:
+        RESULT_CACHE.parent.mkdir(parents=True, exist_ok=True)
+        with open(RESULT_CACHE, "w") as f:
+            json.dump({"key": key, "passed": sorted(passed)}, f)
+    except OSError:
+        pass
+
+
+def _init_worker(session_root, tmpdir, verbose):
+    """Give a test worker process the same settings as main()"""
+    global _SESSION_ROOT, VERBOSE
+    _SESSION_ROOT = session_root
+    tempfile.tempdir = tmpdir
+    VERBOSE = verbose
+
+
+def _run_captured(test):
+    """
+    Run one test function, returning whether it passed, its assertion
+    counts and what it printed. A test that raises counts as failed, with
+    the traceback added to its output, so the other tests still report.
+    """
+    output = io.StringIO()
+    del TestCase.completed[:]
+    with redirect_stdout(output):
+        try:
+            passed = test()
+        except Exception:
+            print(f"  [ERROR] {test.__name__} raised an exception:\n{traceback.format_exc().rstrip()}")
+            passed = False
+    assertions = sum(p for p, _ in TestCase.completed)
+    total = sum(t for _, t in TestCase.completed)
+    return passed, assertions, total, output.getvalue()
+
+
+def main():
+    global _SESSION_ROOT, VERBOSE
+    parser = argparse.ArgumentParser(description="Run the deduplicate_trees.py test suite.")
+    parser.add_argument("--cache", action="store_true",
+                        help="Skip tests that passed last time with the same sources, "
+                             "platform and temporary directory")
+    parser.add_argument("--verbose", "-v", action="store_true",
+                        help="Print passing assertions as well as failing ones")
+    parser.add_argument("--failfast", action="store_true",
+                        help="Run the tests one at a time and stop at the first failing test")
+    args = parser.parse_args()
+    VERBOSE = args.verbose
+    
+    use_ram_temp_dir()
+    
+    with tempfile.TemporaryDirectory(prefix="dedup_tests_") as session_root:
+        _SESSION_ROOT = session_root
+        try:
+            return run_all_tests(use_cache=args.cache, failfast=args.failfast)
+        finally:
+            _SESSION_ROOT = None
+            if _IO_POOL is not None:
+                _IO_POOL.shutdown()
+
+
+def run_all_tests(use_cache=False, failfast=False):
+    """
+    Run every test in TESTS and print their results in order.
     
-    all_passed &= test_partial_directory_overlap()
-    print()
+    With use_cache, tests recorded in RESULT_CACHE as having passed with the
+    same source_key() are skipped, and the cache is updated afterwards.
     
-    all_passed &= test_files_only_in_safe_directory()
-    print()
+    The tests use separate directories, so they run at the same time in a
+    pool of worker processes. Processes rather than threads are needed
+    because run_script() swaps the process-wide stdin and stdout. Each test's
+    output is captured and printed as a block, in the order of TESTS.
     
-    all_passed &= test_many_files()
+    With failfast, the tests instead run one at a time in this process and
+    the remaining ones are not run once a test fails.
+    """
+    print("=" * 70)
+    print("Running Black-Box Test Suite for deduplicate_trees.py")
+    print("=" * 70)
     print()
     
-    all_passed &= test_readonly_file_in_safe()
+    all_passed = True
+    key = source_key() if use_cache else None
+    cached = load_passed_tests(key) if use_cache else set()
+    to_run = [test for test in TESTS if test.__name__ not in cached]
+    
+    results = {}
+    if failfast:
+        for test in to_run:
+            results[test] = _run_captured(test)
+            if not results[test][0]:
+                break
+    elif to_run:
+        with ProcessPoolExecutor(max_workers=min(len(to_run), os.cpu_count() or 1),
+                                 initializer=_init_worker,
+                                 initargs=(_SESSION_ROOT, tempfile.tempdir, VERBOSE)) as pool:
+            results = dict(zip(to_run, pool.map(_run_captured, to_run)))
+    
+    passed_tests = set()
+    assertions_passed = assertions_total = 0
+    for test in TESTS:
+        if test in results:
+            passed, test_passed, test_total, output = results[test]
+            assertions_passed += test_passed
+            assertions_total += test_total
+            if output:
+                print(output)
+        elif test.__name__ in cached:
+            passed = True
+            if VERBOSE:
+                print(f"{test.__name__}: skipped, passed last time with the same sources\n")
+        else:
+            # Not reached because an earlier test failed with --failfast
+            passed = False
+        all_passed &= passed
+        if passed:
+            passed_tests.add(test.__name__)
+    
+    if use_cache:
+        save_passed_tests(key, passed_tests)
+    
+    not_run = len(to_run) - len(results)
+    print(f"{assertions_passed}/{assertions_total} assertions passed in {len(results)} tests"
+          + (f", {len(TESTS) - len(to_run)} skipped (unchanged since they passed)"
+             if len(to_run) < len(TESTS) else "")
+          + (f", {not_run} not run after a failure (--failfast)" if not_run else ""))
     print()
-    
     print("=" * 70)
     if all_passed:
         print("ALL TESTS PASSED")